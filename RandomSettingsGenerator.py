@@ -1,6 +1,9 @@
 """ Run this script to roll a random settings seed! """
 import sys
 import os
+import json
+import random
+import sqlite3
 import traceback
 import argparse
 
@@ -8,9 +11,13 @@ import update_randomizer as ur
 ur.check_python()
 ur.check_version()
 
-from utils import cleanup
+from utils import cleanup, seeded_rng
+import timing
 import rsl_tools as tools
 import roll_settings as rs
+import memory_plando
+import failure_store
+from randomizer_errors import classify_failure
 
 global_override_fname = None
 
@@ -75,11 +82,50 @@ def get_command_line_args():
                         help="Generate the specified number of seeds for benchmarking.")
     parser.add_argument("--benchmark", action="store_true",
                         help="Compare the specified weights file to spoiler log empirical data.")
+    parser.add_argument("--simulate", type=range_limited_int_type, default=None,
+                        help="Compare the specified weights file to this many rolled settings, without running the randomizer.")
+    parser.add_argument("--exact", action="store_true",
+                        help="Compute the exact rate of every option of the specified weights file, without rolling any settings.")
     parser.add_argument("--plando_retries", type=range_limited_int_type, default=5,
                         help="Retry limit for generating a plando file.")
     parser.add_argument("--rando_retries", type=range_limited_int_type, default=3,
                         help="Retry limit for running the randomizer with a given settings plando.")
+    parser.add_argument("--workers", type=range_limited_int_type, default=None,
+                        help="Run the randomizer in this many warm worker processes instead of a new process per attempt.")
+    parser.add_argument("--partial_reroll", action="store_true",
+                        help="When the randomizer fails, only reroll the settings related to the failure. Biases the settings of accepted seeds.")
+    parser.add_argument("--rom", default=None,
+                        help="Path to the Ocarina of Time rom. By default the working directory is searched.")
+    parser.add_argument("--jobs", type=range_limited_int_type, default=1,
+                        help="Roll and patch this many --stress_test seeds at once in separate processes.")
+    parser.add_argument("--rng_seed", default=None,
+                        help="Seed the settings roll so the same seed, weights and options reproduce the same plandos.")
+    parser.add_argument("--rando_timeout", type=range_limited_int_type, default=None, metavar="SECONDS",
+                        help="Kill a randomizer attempt that runs longer than this and roll new settings.")
+    parser.add_argument("--rando_memory", type=range_limited_int_type, default=None, metavar="MB",
+                        help="Limit the memory of each randomizer attempt to this many megabytes.")
+    parser.add_argument("--in_memory_plando", action="store_true",
+                        help="Hand each plando to the randomizer in memory and only save it to a file if the randomizer fails.")
+    parser.add_argument("--failure_rates", default=None, metavar="SETTING",
+                        help="Show how often the randomizer failed with each value of this setting.")
+    parser.add_argument("--failure_signatures", action="store_true",
+                        help="Show the errors the randomizer failed with, most common first.")
+    parser.add_argument("--export_failures", nargs="?", const="failed_settings", default=None, metavar="DIR",
+                        help="Write every failed plando and its log from the failure store as files (default failed_settings).")
+    parser.add_argument("--timing_log", default=None,
+                        help="Append how long each phase of every seed took to this file, one JSON line per seed.")
+    parser.add_argument("--profile", nargs="?", const="rsl_generator.prof", default=None, metavar="FILE",
+                        help="Run the generator under cProfile and save the stats to this file (default rsl_generator.prof).")
+    parser.add_argument("--serve", type=range_limited_int_type, default=None, metavar="PORT",
+                        help="Keep running and answer generation requests on this localhost port.")
+    parser.add_argument("--queue_size", type=range_limited_int_type, default=16,
+                        help="How many --serve requests can wait for a free job before new ones are turned away.")
     args = parser.parse_args()
+    if args.workers is not None and (args.rando_timeout is not None or args.rando_memory is not None):
+        parser.error("--rando_timeout and --rando_memory run every attempt in its own process and can't be used with --workers")
+    if args.in_memory_plando and not memory_plando.supported():
+        print("RSL GENERATOR: IN-MEMORY PLANDOS ARE ONLY SUPPORTED ON LINUX, WRITING PLANDO FILES INSTEAD.")
+        args.in_memory_plando = False
 
 
     # Parse weights override file
@@ -104,58 +150,306 @@ def get_command_line_args():
         "seed_count": args.seed_count,
         "benchmark": args.benchmark,
         "plando_retries": args.plando_retries,
-        "rando_retries": args.rando_retries
+        "rando_retries": args.rando_retries,
+        "workers": args.workers,
+        "rom": args.rom,
+        "partial_reroll": args.partial_reroll,
+        "simulate": args.simulate,
+        "exact": args.exact,
+        "jobs": args.jobs if args.simulate is not None or args.serve is not None else min(args.jobs, args.seed_count),
+        "rng_seed": args.rng_seed,
+        "rando_timeout": args.rando_timeout,
+        "rando_memory": args.rando_memory,
+        "in_memory_plando": args.in_memory_plando,
+        "failure_rates": args.failure_rates,
+        "failure_signatures": args.failure_signatures,
+        "export_failures": args.export_failures,
+        "timing_log": args.timing_log,
+        "profile": args.profile,
+        "serve": args.serve,
+        "queue_size": args.queue_size
     }
 
 
 def main():
     """ Roll a random settings seed """
     args = get_command_line_args()
+    if args["profile"] is not None:
+        profile_run(args)
+    else:
+        run(args)
 
+
+def profile_run(args):
+    """ Run the generator under cProfile, save the stats and print the most expensive calls """
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, args)
+    finally:
+        profiler.dump_stats(args["profile"])
+        print(f"RSL GENERATOR: PROFILE SAVED TO {args['profile']}. SLOWEST CALLS BY CUMULATIVE TIME:")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+def run(args):
+    """ Do whatever the command line asked for """
     # If we only want to check for new/changed settings
     if args["check_new_settings"]:
         _, _, rslmultis, rslweights = rs.load_weights_file("weights/rsl_season7.json")
         tools.check_for_setting_changes(rslweights, rs.generate_balanced_weights(None))
         return
 
+    # If we only want to look at the failure store
+    if args["failure_rates"] is not None:
+        failure_store.print_failure_rates(args["failure_rates"])
+        return
+    if args["failure_signatures"]:
+        failure_store.print_failure_signatures()
+        return
+    if args["export_failures"] is not None:
+        failure_store.export_failures(args["export_failures"])
+        return
+
     # If we only want to benchmark weights
     if args["benchmark"]:
-        weight_options, weight_multiselect, weight_dict, start_with = rs.generate_weights_override(WEIGHTS, args["override_fname"])
-        tools.benchmark_weights(weight_options, weight_dict, weight_multiselect)
+        profile = rs.WeightsProfile.load(WEIGHTS, args["override_fname"])
+        tools.benchmark_weights(profile.weight_options, profile.weight_dict, profile.weight_multiselect)
         return
 
-    for i in range(args["seed_count"]):
-        if args["seed_count"] > 1:
-            print("Rolling test seed", i + 1, "...")
+    # If we only want the exact rates of the weights
+    if args["exact"]:
+        from exact_weights import exact_weights
+        exact_weights(rs.WeightsProfile.load(WEIGHTS, args["override_fname"]))
+        return
+
+    # If we only want to check weights against simulated settings
+    if args["simulate"] is not None:
+        from simulate_weights import simulate_weights
+        profile = rs.WeightsProfile.load(WEIGHTS, args["override_fname"])
+        simulate_weights(profile, args["simulate"], args["jobs"], args["rng_seed"])
+        return
+
+    # If we want to keep running and answer generation requests
+    if args["serve"] is not None:
+        serve(args)
+        return
+
+    with timing.collect() as setup_times:
+        # Load and merge the weights once for every seed and retry
+        profile = rs.WeightsProfile.load(WEIGHTS, args["override_fname"])
+
+        # Find and decompress the rom once for every randomizer run
+        if not args["no_seed"]:
+            with timing.phase("rom_discovery"):
+                args["rom"] = tools.prepare_rom(tools.find_rom_file(args["rom"]))
+    timing.write_record(args["timing_log"], timing.setup_record(setup_times))
+
+    pool = None
+    if args["workers"] is not None and not args["no_seed"] and args["jobs"] == 1:
+        # Imported here to keep multiprocessing out of the plando-only startup path
+        from randomizer_workers import RandomizerPool
+        pool = RandomizerPool(workers=args["workers"])
+    elif not args["no_seed"] and args["jobs"] == 1:
+        pool = make_randomizer_runner(args)
+
+    try:
+        if args["jobs"] > 1:
+            records = roll_seeds_parallel(args, profile)
+        else:
+            records = roll_seeds(args, profile, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+    if args["seed_count"] > 1:
+        timing.print_summary(records)
+
+
+def serve(args):
+    """ Run the local generation service with the rom and randomizer workers kept warm """
+    from rsl_service import serve as serve_requests
+    if not args["no_seed"]:
+        args["rom"] = tools.prepare_rom(tools.find_rom_file(args["rom"]))
+    pool = None
+    if args["workers"] is not None and not args["no_seed"]:
+        from randomizer_workers import RandomizerPool
+        pool = RandomizerPool(workers=args["workers"])
+    elif not args["no_seed"]:
+        pool = make_randomizer_runner(args, concurrency=args["jobs"])
+    try:
+        serve_requests(args, WEIGHTS, roll_seed, args["serve"], args["queue_size"], pool)
+    finally:
+        if pool is not None:
+            pool.close()
 
-        if LOG_ERRORS:
-            # Clean up error log from previous run, if any
-            cleanup('ERRORLOG.TXT')
 
-        plandos_to_cleanup = []
+def make_randomizer_runner(args, concurrency=1):
+    """ A RandomizerRunner if attempts need a timeout or memory limit, otherwise None """
+    if args["rando_timeout"] is None and args["rando_memory"] is None:
+        return None
+    from randomizer_runner import RandomizerRunner
+    memory_limit = args["rando_memory"] * 1024 * 1024 if args["rando_memory"] is not None else None
+    return RandomizerRunner(timeout=args["rando_timeout"], memory_limit=memory_limit, concurrency=concurrency)
+
+
+def roll_seed(args, profile, seed_index=0, pool=None, output_dir=None):
+    """ Roll settings and patch a single seed, retrying with new settings when the randomizer fails.
+    The patch is saved to output_dir, or to the patches directory by default. """
+    plando_filename_base = args["plando_filename_base"]
+    if args["jobs"] > 1:
+        # Keep plando names from concurrently rolled seeds apart
+        plando_filename_base += f"_{seed_index + 1}"
+
+    completed_process = None
+    plandos_to_cleanup = []
+    draws = None
+    reroll = None
+    last_failure = None
+    # Plandos are stored in the failure store when they fail, so their files always go,
+    # including when the last retry fails and the seed is given up
+    try:
         for i in range(args["plando_retries"]):
-            plando_filename = rs.generate_plando(WEIGHTS, args["override_fname"], args["no_seed"], args["plando_filename_base"])
+            # Every seed and retry gets its own stream so any of them can be reproduced on its own
+            rng = random if args["rng_seed"] is None else seeded_rng(args["rng_seed"], seed_index, i)
+            if reroll is not None:
+                draws = rs.draw_base_settings(profile, draws, reroll, rng)
+            draws, random_settings = rs.roll_valid_settings(profile, draws, rng=rng)
+            plando_json = None
+            if args["in_memory_plando"] and not args["no_seed"]:
+                # Never written to a file, failures are kept in the failure store
+                plando_filename = rs.new_plando_filename(plando_filename_base)
+                with timing.phase("plando_write"):
+                    plando_json = json.dumps(rs.plando_output(random_settings), separators=(',', ':'))
+            else:
+                plando_filename = rs.write_plando(random_settings, args["no_seed"], plando_filename_base)
             if args["no_seed"]:
                 break
-            plandos_to_cleanup.append(plando_filename)
-            completed_process = tools.generate_patch_file(plando_filename=plando_filename, worldcount=args["worldcount"], max_retries=args["rando_retries"])
+            if plando_json is None:
+                plandos_to_cleanup.append(plando_filename)
+            completed_process = tools.generate_patch_file(plando_filename=plando_filename, worldcount=args["worldcount"], max_retries=args["rando_retries"], pool=pool, rom=args["rom"], rng=None if rng is random else rng, settings_sidecar=args["seed_count"] > 1, plando_json=plando_json, output_dir=output_dir)
+            # Stress test successes are recorded too, as the baseline for failure rates by setting value
+            success = completed_process.returncode == 0
+            if not success or args["seed_count"] > 1:
+                try:
+                    failure_store.record(rs.plando_output(random_settings), plando_filename, success, completed_process.stderr)
+                except (sqlite3.Error, OSError) as ex:
+                    print(f"RSL GENERATOR: WARNING: COULD NOT ADD THE PLANDO TO {failure_store.FAILURE_STORE}: {ex}")
+                    if not success and plando_json is None:
+                        # Keep the plando file instead, it isn't stored anywhere else
+                        plandos_to_cleanup.remove(plando_filename)
+                        print(f"RSL GENERATOR: THE FAILED PLANDO WAS KEPT AT {os.path.join('data', plando_filename)}")
             if completed_process.returncode == 0:
                 break
-            plandos_to_cleanup.remove(plando_filename)
-            if os.path.isfile(os.path.join('data', plando_filename)):
-                if not os.path.isdir('failed_settings'):
-                    os.mkdir('failed_settings')
-                os.rename(os.path.join('data', plando_filename), os.path.join('failed_settings', plando_filename))
-                with open(os.path.join('failed_settings', plando_filename+'_errlog'), 'w+') as failed_err_msg:
-                    failed_err_msg.write(completed_process.stderr)
             if i == args["plando_retries"]-1 and completed_process.returncode != 0:
                 raise tools.RandomizerError(completed_process.stderr)
 
+            # With --partial_reroll, reroll only the settings related to a recognized failure. Unknown failures,
+            # and the same failure twice in a row, get completely new settings so kept settings can't get stuck.
+            # Settings kept from a failed plando make accepted seeds stop following the weights given success,
+            # so a full reroll is the default.
+            failure, responsible = classify_failure(completed_process.stderr)
+            if not args["partial_reroll"] or responsible is None or failure == last_failure:
+                draws = None
+                reroll = None
+                last_failure = None
+            else:
+                print(f"RSL GENERATOR: RANDOMIZER FAILED WITH {failure.upper()}, REROLLING RELATED SETTINGS ONLY.")
+                reroll = set(responsible)
+                last_failure = failure
+    finally:
+        for plando_filename in plandos_to_cleanup:
+            cleanup(os.path.join('data', plando_filename))
+    return completed_process
+
+
+def roll_seeds(args, profile, pool=None):
+    """ Roll the requested number of seeds one after another and return their phase times """
+    records = []
+    for i in range(args["seed_count"]):
+        if args["seed_count"] > 1:
+            print("Rolling test seed", i + 1, "...")
+
+        if LOG_ERRORS:
+            # Clean up error log from previous run, if any
+            cleanup('ERRORLOG.TXT')
+
+        with timing.collect() as times:
+            success = False
+            try:
+                completed_process = roll_seed(args, profile, i, pool)
+                success = True
+            finally:
+                records.append(timing.seed_record(i, times, success))
+                timing.write_record(args["timing_log"], records[-1])
         if not args["no_seed"]:
             print(completed_process.stderr.split("Patching ROM")[-1])
+    return records
 
-        for plando_filename in plandos_to_cleanup:
-            cleanup(os.path.join('data', plando_filename))
+
+# Set in each --jobs process by _init_job
+_job_profile = None
+_job_randomizer = None
+
+def _init_job(args, profile):
+    global _job_profile, _job_randomizer
+    _job_profile = profile
+    # Keep the randomizer imported between seeds
+    if args["workers"] is not None and not args["no_seed"]:
+        from randomizer_workers import InProcessRandomizer
+        _job_randomizer = InProcessRandomizer()
+    elif not args["no_seed"]:
+        _job_randomizer = make_randomizer_runner(args)
+
+
+def _roll_seed_job(args, seed_index):
+    with timing.collect() as times:
+        try:
+            completed_process = roll_seed(args, _job_profile, seed_index, _job_randomizer)
+        except Exception as ex:
+            # Sent back to the main process along with the error
+            ex.phase_times = timing.seed_record(seed_index, times, False)
+            raise
+    return completed_process, timing.seed_record(seed_index, times, True)
+
+
+def roll_seeds_parallel(args, profile):
+    """ Roll the requested number of seeds in a pool of args["jobs"] processes and return their phase times """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    if LOG_ERRORS:
+        cleanup('ERRORLOG.TXT')
+
+    seed_count = args["seed_count"]
+    failures = []
+    records = []
+    with ProcessPoolExecutor(max_workers=args["jobs"], initializer=_init_job, initargs=(args, profile)) as executor:
+        futures = {executor.submit(_roll_seed_job, args, i): i for i in range(seed_count)}
+        for finished, future in enumerate(as_completed(futures), 1):
+            seed_index = futures[future]
+            try:
+                completed_process, record_data = future.result()
+            except Exception as ex:
+                # Any error only fails its own seed, e.g. an invalid plando or a job process that was killed
+                failures.append((seed_index, ex))
+                # Job processes that died never sent their phase times back
+                if getattr(ex, "phase_times", None) is not None:
+                    records.append(ex.phase_times)
+                    timing.write_record(args["timing_log"], ex.phase_times)
+                print(f"RSL GENERATOR: TEST SEED {seed_index + 1} FAILED WITH {type(ex).__name__} ({finished} OF {seed_count} FINISHED)")
+                continue
+            records.append(record_data)
+            timing.write_record(args["timing_log"], record_data)
+            print(f"RSL GENERATOR: TEST SEED {seed_index + 1} DONE ({finished} OF {seed_count} FINISHED)")
+            if not args["no_seed"]:
+                print(completed_process.stderr.split("Patching ROM")[-1])
+
+    print(f"RSL GENERATOR: {seed_count - len(failures)} OF {seed_count} TEST SEEDS SUCCEEDED")
+    if failures:
+        timing.print_summary(records)
+        summary = "\n".join(f"Test seed {seed_index + 1}: " + ("reached the plando retry limit" if isinstance(ex, tools.RandomizerError) else f"{type(ex).__name__}: {ex}")
+                             for seed_index, ex in sorted(failures, key=lambda f: f[0]))
+        raise tools.RandomizerError(f"{len(failures)} test seeds failed:\n{summary}\nLast error:\n{failures[-1][1]}")
+    return records
 
 
 if __name__ == "__main__":
@@ -0,0 +1,513 @@
+""" Roll many plandos at once for bulk work such as simulations and pre-rolled seed pools.
+Every setting is a column holding one NumPy array of option codes for the whole batch, and the
+conditionals are applied to whole columns with masks. Rows are only turned back into plando
+dicts when they are written out. NumPy is only needed by this module. """
+import json
+import random
+import conditionals as conds
+import roll_settings as rs
+from multiselects import ms_option_lookup, invalid_settings
+from settings_schema import get_schema
+from samplers import UniformIntSampler
+from utils import geometric_weights, string_to_int, seeded_rng
+
+# Set by load_numpy, so that importing this module doesn't need NumPy
+np = None
+
+
+def load_numpy():
+    """ Import NumPy, which only the batch roller needs. """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("RSL GENERATOR ERROR: ROLLING PLANDOS IN BATCHES NEEDS NUMPY. INSTALL IT WITH: pip install numpy") from None
+        np = numpy
+    return np
+
+
+def batch_rng(base_seed, *path):
+    """ A NumPy generator for one part of a run, derived like utils.seeded_rng. """
+    load_numpy()
+    return np.random.default_rng(seeded_rng(base_seed, *path).getrandbits(128))
+
+
+class CodeColumn:
+    """ A setting with one option per plando, stored as codes into a list of options.
+    A code of -1 leaves the setting out of that plando. """
+
+    def __init__(self, options, codes):
+        self.options = list(options)
+        self.codes = codes
+
+    @classmethod
+    def empty(cls, size):
+        return cls([], np.full(size, -1, dtype=np.int32))
+
+    @property
+    def present(self):
+        return self.codes >= 0
+
+    def code(self, option):
+        """ The code of an option, adding it to the options if it is new. """
+        for code, known in enumerate(self.options):
+            if type(known) is type(option) and known == option:
+                return code
+        self.options.append(option)
+        return len(self.options) - 1
+
+    def matches(self, *options):
+        """ The rows set to any of the given options. """
+        codes = [code for code, option in enumerate(self.options) if option in options]
+        return np.isin(self.codes, codes)
+
+    def assign(self, mask, option):
+        self.codes[mask] = self.code(option)
+
+    def assign_codes(self, mask, options, indexes):
+        """ Set the masked rows to options[indexes], e.g. codes drawn from a sampler's options. """
+        lookup = np.array([self.code(option) for option in options], dtype=np.int32)
+        self.codes[mask] = lookup[indexes]
+
+    def remove(self, mask):
+        self.codes[mask] = -1
+
+    def group_keys(self):
+        return self.codes
+
+    def value(self, row):
+        code = self.codes[row]
+        return None if code < 0 else self.options[code]
+
+    def format(self, setting):
+        self.options = [rs.format_setting_value(setting, option) for option in self.options]
+
+    def value_counts(self):
+        """ How many plandos have each option, leaving out plandos without the setting. """
+        counts = np.bincount(self.codes[self.codes >= 0], minlength=len(self.options))
+        totals = {}
+        for option, count in zip(self.options, counts.tolist()):
+            if count:
+                # Options such as a hint_dist_user dict can't be keys, so they are counted by their JSON
+                key = (type(option), json.dumps(option, sort_keys=True) if isinstance(option, (dict, list)) else option)
+                if key in totals:
+                    totals[key][1] += count
+                else:
+                    totals[key] = [option, count]
+        return [(option, count) for option, count in totals.values()]
+
+
+class ListColumn:
+    """ A list setting such as a multiselect, stored as a row of flags per plando over its items. """
+
+    def __init__(self, items, selected, present=None):
+        self.items = list(items)
+        self.selected = selected
+        self.present = np.ones(len(selected), dtype=bool) if present is None else present
+
+    @classmethod
+    def constant(cls, size, items):
+        """ Every plando gets the same list. """
+        return cls(items, np.ones((size, len(items)), dtype=bool))
+
+    def item_index(self, item):
+        """ The flag column of an item, adding one if it is new. """
+        if item not in self.items:
+            self.items.append(item)
+            self.selected = np.hstack([self.selected, np.zeros((len(self.selected), 1), dtype=bool)])
+        return self.items.index(item)
+
+    def assign(self, mask, value):
+        indexes = [self.item_index(item) for item in value]
+        flags = np.zeros(len(self.items), dtype=bool)
+        flags[indexes] = True
+        self.selected[mask] = flags
+        self.present[mask] = True
+
+    def remove(self, mask):
+        self.present[mask] = False
+
+    def group_keys(self):
+        # One number per distinct list, with -1 when the setting is left out
+        keys = np.unique(_row_patterns(self.selected), return_inverse=True)[1].reshape(-1)
+        return np.where(self.present, keys, -1)
+
+    def value(self, row):
+        if not self.present[row]:
+            return None
+        return [item for item, selected in zip(self.items, self.selected[row]) if selected]
+
+    def format(self, setting):
+        # Lists are passed to the randomizer as rolled, but unsupported setting types still raise
+        rs.format_setting_value(setting, [])
+
+    def value_counts(self):
+        """ How many plandos have each list, leaving out plandos without the setting. """
+        selected = self.selected[self.present]
+        _, rows, counts = np.unique(_row_patterns(selected), return_index=True, return_counts=True)
+        return [(tuple(item for item, flag in zip(self.items, selected[row]) if flag), count)
+                for row, count in zip(rows.tolist(), counts.tolist())]
+
+
+def _row_patterns(selected):
+    """ Each row of a flag matrix packed into one comparable value, which np.unique sorts much
+    faster than it compares whole rows. """
+    packed = np.packbits(selected, axis=1)
+    if packed.shape[1] == 0:
+        return np.zeros(len(selected), dtype=np.uint8)
+    packed = np.ascontiguousarray(packed)
+    return packed.view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+
+
+class PlandoBatch:
+    """ size plandos rolled together, with one column per setting in the order a plando lists them. """
+
+    def __init__(self, size):
+        self.size = size
+        self.columns = {}
+        # Items added to the starting items by conditionals, as {starting items setting: {item: rows}}
+        self.extra_starting_items = {"starting_inventory": {}, "starting_songs": {}, "starting_equipment": {}}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, setting):
+        return self.columns[setting]
+
+    def __setitem__(self, setting, column):
+        self.columns[setting] = column
+
+    def __contains__(self, setting):
+        return setting in self.columns
+
+    def set_value(self, setting, mask, value):
+        """ Set a setting to a single value in the masked rows, adding the column if needed. """
+        if setting not in self.columns:
+            if isinstance(value, list):
+                self.columns[setting] = ListColumn([], np.zeros((self.size, 0), dtype=bool), np.zeros(self.size, dtype=bool))
+            else:
+                self.columns[setting] = CodeColumn.empty(self.size)
+        self.columns[setting].assign(mask, value)
+
+    def plando(self, row):
+        """ The settings of one plando, as roll_settings.roll_random_settings would return them. """
+        settings = {}
+        for setting, column in self.columns.items():
+            value = column.value(row)
+            if value is not None:
+                settings[setting] = value
+        return settings
+
+    def plandos(self):
+        for row in range(self.size):
+            yield self.plando(row)
+
+    def value_counts(self, setting):
+        """ A list of (value, number of plandos) for a setting, with list values as tuples. """
+        return self.columns[setting].value_counts()
+
+
+def _draw_indexes(sampler, size, rng):
+    """ Draw size indexes into a sampler's options with its weights. """
+    if isinstance(sampler, UniformIntSampler):
+        return rng.integers(0, len(sampler.options), size)
+    return _choose(rng, size, sampler.weights)
+
+
+def _choose(rng, size, weights):
+    """ Draw size indexes into weights, like random.choices. """
+    cumulative = np.cumsum(np.asarray(weights, dtype=float))
+    indexes = np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side='right')
+    return np.minimum(indexes, len(cumulative) - 1)
+
+
+def _chance(rng, size, percent):
+    """ Rows that pass a percent chance, like random.choices([True, False], weights=[percent, 100-percent]). """
+    return rng.random(size) * 100 < percent
+
+
+def _sample_flags(rng, eligible, counts):
+    """ For each row, pick counts[row] of its eligible items without replacement, like random.sample. """
+    keys = rng.random(eligible.shape)
+    keys[~eligible] = 2.0
+    ranks = keys.argsort(axis=1).argsort(axis=1)
+    return eligible & (ranks < counts[:, None])
+
+
+def _apply_by_group(batch, conditional, inputs, mask=None, **kwargs):
+    """ Run a scalar conditional once for each distinct combination of its input settings among
+    the masked rows, and copy what it set back onto those rows. Only for conditionals, or parts of
+    them, that don't draw anything. """
+    mask = np.ones(batch.size, dtype=bool) if mask is None else mask
+    # Settings that no plando has are left out, as they would be missing from a scalar plando
+    inputs = [setting for setting in inputs if setting in batch]
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0:
+        return
+    keys = np.stack([batch[setting].group_keys()[rows] for setting in inputs], axis=1)
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for group in range(len(groups)):
+        group_rows = rows[inverse == group]
+        group_mask = np.zeros(batch.size, dtype=bool)
+        group_mask[group_rows] = True
+        before = {}
+        for setting in inputs:
+            value = batch[setting].value(group_rows[0])
+            if value is not None:
+                before[setting] = value
+        after = {setting: list(value) if isinstance(value, list) else value for setting, value in before.items()}
+        extra_starting_items = {key: [] for key in batch.extra_starting_items}
+        conditional(after, weight_dict=None, extra_starting_items=extra_starting_items, rng=random, **kwargs)
+        for setting, value in after.items():
+            if setting not in before or before[setting] != value:
+                batch.set_value(setting, group_mask, value)
+        for setting in before:
+            if setting not in after:
+                batch[setting].remove(group_mask)
+        for key, items in extra_starting_items.items():
+            for item in items:
+                extra = batch.extra_starting_items[key]
+                extra[item] = extra.get(item, np.zeros(batch.size, dtype=bool)) | group_mask
+
+
+def _exclude_and_redraw(batch, profile, rng, setting, mask, excluded):
+    """ Redraw a setting in the masked rows without the excluded options. Rows outside the mask keep
+    their first draw, which has the same distribution as the unconditional redraw in conditionals.py. """
+    sampler = profile.sampler(setting).without(excluded)
+    batch[setting].assign_codes(mask, sampler.options, _draw_indexes(sampler, int(mask.sum()), rng))
+
+
+def exclude_minimal_triforce_hunt(batch, profile, rng, cparams):
+    _exclude_and_redraw(batch, profile, rng, 'item_pool_value', batch['triforce_hunt'].matches("true"), ['minimal'])
+
+
+def exclude_ice_trap_misery(batch, profile, rng, cparams):
+    _exclude_and_redraw(batch, profile, rng, 'junk_ice_traps', batch['damage_multiplier'].matches('quadruple', 'ohko'), ['mayhem', 'onslaught'])
+
+
+def exclude_mapcompass_info_remove(batch, profile, rng, cparams):
+    _exclude_and_redraw(batch, profile, rng, 'shuffle_mapcompass', batch['enhance_map_compass'].matches("true"), ['remove'])
+
+
+def restrict_one_entrance_randomizer(batch, profile, rng, cparams):
+    erlist = [("shuffle_interior_entrances", "off"), ("shuffle_grotto_entrances", "false"),
+              ("shuffle_dungeon_entrances", "off"), ("shuffle_overworld_entrances", "false")]
+    enabled = np.stack([~batch[setting].matches(off_option) for setting, off_option in erlist], axis=1)
+    restricted = enabled.sum(axis=1) >= 2
+    # Keep one of the enabled pools at random
+    keys = rng.random(enabled.shape)
+    keys[~enabled] = -1.0
+    keepon = keys.argmax(axis=1)
+    for index, (setting, off_option) in enumerate(erlist):
+        batch[setting].assign(restricted & (keepon != index), off_option)
+
+
+def shuffle_goal_hints(batch, profile, rng, cparams):
+    goals = _chance(rng, batch.size, string_to_int(cparams[0]))
+    # A 100% chance makes the scalar conditional only do the swap
+    _apply_by_group(batch, conds.shuffle_goal_hints, ['hint_dist'], goals, cparams=[100])
+
+
+def split_collectible_bridge_conditions(batch, profile, rng, cparams):
+    chance_of_collectible_wincon = string_to_int(cparams[0])
+    typeweights = [int(x) for x in cparams[1].split('/')]
+    weights = [int(x) for x in cparams[2].split('/')]
+
+    skull_wincon = _chance(rng, batch.size, chance_of_collectible_wincon)
+    condition = _choose(rng, batch.size, typeweights)
+    whichtype = _choose(rng, batch.size, weights)
+    for index, option in enumerate(["hearts", "tokens"]):
+        rows = skull_wincon & (condition == index)
+        batch['bridge'].assign(rows & (whichtype != 1), option)
+        batch['shuffle_ganon_bosskey'].assign(rows & (whichtype != 0), option)
+
+
+def invert_dungeons_mq_count(batch, profile, rng, cparams):
+    invert = batch['mq_dungeons_mode'].matches('count') & _chance(rng, batch.size, string_to_int(cparams[0]))
+    _apply_by_group(batch, conds.invert_dungeons_mq_count, ['mq_dungeons_mode', 'mq_dungeons_count'], invert, cparams=[100])
+
+
+def select_one_pots_crates_freestanding(batch, profile, rng, cparams):
+    chance_one_is_on = string_to_int(cparams[0])
+    setting_weights = [int(x) for x in cparams[1].split('/')]
+    weights = [int(x) for x in cparams[2].split('/')]
+
+    # random.randint(0, 100) includes 100
+    one_is_on = rng.integers(0, 101, batch.size) < chance_one_is_on
+    which_setting = _choose(rng, batch.size, setting_weights)
+    which_option = _choose(rng, batch.size, weights)
+    for setting_index, setting in enumerate(["shuffle_pots", "shuffle_crates", "shuffle_freestanding_items"]):
+        for option_index, option in enumerate(["overworld", "dungeons", "all"]):
+            batch.set_value(setting, one_is_on & (which_setting == setting_index) & (which_option == option_index), option)
+
+
+def geometrically_draw_dungeon_shortcuts(batch, profile, rng, cparams):
+    items = ms_option_lookup["dungeon_shortcuts"]
+    counts = _choose(rng, batch.size, geometric_weights(len(items) + 1))
+    batch["dungeon_shortcuts"] = ListColumn(items, _sample_flags(rng, np.ones((batch.size, len(items)), dtype=bool), counts))
+
+
+def limit_overworld_entrances_in_mixed_entrance_pools(batch, profile, rng, cparams):
+    pools = batch["mix_entrance_pools"]
+    mixed = pools.present & pools.selected.any(axis=1)
+    include_overworld = _chance(rng, batch.size, string_to_int(cparams[0]))
+    overworld = pools.item_index("Overworld")
+    pools.selected[mixed & ~include_overworld, overworld] = False
+
+
+def limit_mixed_pool_entrances(batch, profile, rng, cparams):
+    max_mixed = int(cparams[0])
+    omit_overworld = bool(cparams[1])
+    pools = batch["mix_entrance_pools"]
+    if omit_overworld:
+        pools.selected[:, pools.item_index("Overworld")] = False
+    over = pools.selected.sum(axis=1) > max_mixed
+    kept = _sample_flags(rng, pools.selected, np.full(batch.size, max_mixed))
+    pools.selected[over] = kept[over]
+
+
+def _deterministic(conditional, inputs):
+    """ A batch conditional for a scalar conditional that only depends on the given settings. """
+    def apply(batch, profile, rng, cparams):
+        _apply_by_group(batch, conditional, inputs, cparams=cparams)
+    return apply
+
+
+BATCH_CONDITIONALS = {
+    "constant_triforce_hunt_extras": _deterministic(conds.constant_triforce_hunt_extras, ['triforce_goal_per_world']),
+    "exclude_minimal_triforce_hunt": exclude_minimal_triforce_hunt,
+    "exclude_ice_trap_misery": exclude_ice_trap_misery,
+    "disable_pot_chest_texture_independence": _deterministic(conds.disable_pot_chest_texture_independence, ['correct_chest_appearances']),
+    "disable_keysanity_independence": _deterministic(conds.disable_keysanity_independence, ['shuffle_smallkeys']),
+    "restrict_one_entrance_randomizer": restrict_one_entrance_randomizer,
+    "random_scrubs_start_wallet": _deterministic(conds.random_scrubs_start_wallet, ['shuffle_scrubs']),
+    "shuffle_goal_hints": shuffle_goal_hints,
+    "replace_dampe_diary_hint_with_lightarrow": _deterministic(conds.replace_dampe_diary_hint_with_lightarrow, ['hint_dist']),
+    "split_collectible_bridge_conditions": split_collectible_bridge_conditions,
+    "adjust_chaos_hint_distro": _deterministic(conds.adjust_chaos_hint_distro, ['hint_dist', 'hint_dist_user']),
+    "exclude_mapcompass_info_remove": exclude_mapcompass_info_remove,
+    "ohko_starts_with_nayrus": _deterministic(conds.ohko_starts_with_nayrus, ['damage_multiplier']),
+    "invert_dungeons_mq_count": invert_dungeons_mq_count,
+    "shuffle_valley_lake_exit": _deterministic(conds.shuffle_valley_lake_exit, ['shuffle_overworld_entrances', 'owl_drops']),
+    "select_one_pots_crates_freestanding": select_one_pots_crates_freestanding,
+    "geometrically_draw_dungeon_shortcuts": geometrically_draw_dungeon_shortcuts,
+    "limit_overworld_entrances_in_mixed_entrance_pools": limit_overworld_entrances_in_mixed_entrance_pools,
+    "limit_mixed_pool_entrances": limit_mixed_pool_entrances,
+    "keysanity_key_get_keyrings": _deterministic(conds.keysanity_key_get_keyrings, ['shuffle_smallkeys']),
+}
+
+
+def _draw_starting_item_pool(batch, profile, rng):
+    """ Batch version of roll_settings.draw_starting_item_pool. """
+    schema = get_schema()
+    adult_trade = batch["adult_trade_start"] if "adult_trade_start" in batch else None
+    child_trade = batch["shuffle_child_trade"] if "shuffle_child_trade" in batch else None
+
+    def in_list(column, item_name):
+        if column is None or item_name not in column.items:
+            return np.zeros(batch.size, dtype=bool)
+        return column.present & column.selected[:, column.items.index(item_name)]
+
+    for key, pool in [("starting_inventory", schema.inventory), ("starting_songs", schema.songs), ("starting_equipment", schema.equipment)]:
+        names = list(pool)
+        eligible = np.ones((batch.size, len(names)), dtype=bool)
+        if key == "starting_inventory":
+            for index, item_name in enumerate(pool.values()):
+                if item_name in schema.trade_items:
+                    eligible[:, index] &= in_list(adult_trade, item_name)
+                if item_name in schema.child_trade_items and item_name != 'Zeldas Letter':
+                    eligible[:, index] &= in_list(child_trade, item_name)
+
+        # The number of items is drawn geometrically over the size of each plando's pool
+        pool_sizes = eligible.sum(axis=1)
+        counts = np.zeros(batch.size, dtype=np.int64)
+        for pool_size in np.unique(pool_sizes).tolist():
+            rows = pool_sizes == pool_size
+            counts[rows] = _choose(rng, int(rows.sum()), geometric_weights(pool_size)) if pool_size else 0
+        column = ListColumn(names, _sample_flags(rng, eligible, counts))
+
+        # Forced starting items from the override and items added by conditionals
+        for thing in profile.start_with[key]:
+            column.selected[:, column.item_index(thing)] = True
+        for thing, rows in batch.extra_starting_items[key].items():
+            column.selected[:, column.item_index(thing)] |= rows
+        batch[key] = column
+
+
+def _remove_redundant_settings(batch):
+    """ Batch version of roll_settings.remove_redundant_settings. """
+    index = rs.get_disable_index()
+    for setting in list(batch.columns):
+        if not index.has_rules(setting):
+            continue
+        column = batch[setting]
+        keys = column.group_keys()
+        for key in np.unique(keys[keys >= 0]).tolist():
+            rows = keys == key
+            value = column.value(int(np.argmax(rows)))
+            for other_setting in index.disabled_by(setting, value):
+                if other_setting in batch:
+                    batch[other_setting].remove(rows)
+
+
+def roll_batch(profile, size, rng=None):
+    """ Roll size plandos from a WeightsProfile at once, with the same steps as
+    roll_settings.roll_random_settings applied to whole columns. rng is a NumPy Generator,
+    see batch_rng. Invalid plandos are not rerolled, so check rows with
+    roll_settings.validate_plando before running the randomizer on them. """
+    load_numpy()
+    if rng is None:
+        rng = np.random.default_rng()
+    batch = PlandoBatch(size)
+    weight_options = profile.weight_options
+
+    # Draw every weighted setting and multiselect
+    for setting in profile.settings():
+        sampler = profile.sampler(setting)
+        options = list(sampler.options)
+        batch[setting] = CodeColumn(options, _draw_indexes(sampler, size, rng).astype(np.int32))
+    if profile.weight_multiselect is not None:
+        for setting in invalid_settings:
+            batch[setting] = ListColumn(ms_option_lookup[setting], np.zeros((size, len(ms_option_lookup[setting])), dtype=bool))
+        for setting, options in ms_option_lookup.items():
+            if setting in invalid_settings:
+                continue
+            enabled = _chance(rng, size, profile.weight_multiselect[setting])
+            batch[setting] = ListColumn(options, np.repeat(enabled[:, None], len(options), axis=1))
+
+    # Set the conditionals
+    if profile.conditionals is not None:
+        for cond, details in profile.conditionals.items():
+            if not details[0]:
+                continue
+            if cond not in BATCH_CONDITIONALS:
+                raise NotImplementedError(f"Conditional {cond} has no batch version in batch_settings.py")
+            BATCH_CONDITIONALS[cond](batch, profile, rng, details[1:])
+
+    # Add starting items, tricks, and excluded locations
+    if profile.has_options:
+        if "tricks" in weight_options:
+            batch["allowed_tricks"] = ListColumn.constant(size, weight_options["tricks"])
+        if "disabled_locations" in weight_options:
+            batch["disabled_locations"] = ListColumn.constant(size, weight_options["disabled_locations"])
+        batch["misc_hints"] = ListColumn.constant(size, weight_options["misc_hints"] if "misc_hints" in weight_options else [])
+        if "starting_items" in weight_options and weight_options["starting_items"] == True:
+            _draw_starting_item_pool(batch, profile, rng)
+
+    # Remove plando setting if a _random setting is true
+    for setting in rs.RANDOM_PLANDO_SETTINGS:
+        batch[setting].remove(batch[setting + '_random'].matches("true"))
+
+    # Format numbers and bools once per option instead of once per plando
+    for setting, column in batch.columns.items():
+        column.format(setting)
+
+    _remove_redundant_settings(batch)
+    return batch
+
+
+def write_batch(batch, no_seed, plando_filename_base='random_settings'):
+    """ Save every plando of a batch in the data directory, returning the file names. """
+    return [rs.write_plando(batch.plando(row), no_seed, f"{plando_filename_base}_{row + 1}") for row in range(batch.size)]
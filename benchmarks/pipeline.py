@@ -0,0 +1,340 @@
+""" Measure the throughput of each stage of the settings pipeline for every weights file in
+weights/ and weights/rsl_seasonal_archive/, and compare it to a saved baseline. The randomizer's
+settings tables are replaced by the stub in stub_schema.json, so no randomizer download is needed.
+The committed pipeline_baseline.json records the machine it was made on, and slower stages only
+fail the run on that machine. A change in which weights files are skipped always fails it.
+Run from the repository root: python benchmarks/pipeline.py [--seconds S] [--passes N] [--save_baseline] """
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import statistics
+import platform
+import datetime
+import argparse
+import tempfile
+import itertools
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import settings_schema
+import roll_settings as rs
+import conditionals as conds
+import rsl_tools as tools
+from multiselects import resolve_multiselects, ms_option_lookup
+from utils import seeded_rng, cleanup
+
+STUB_SCHEMA = os.path.join(ROOT, "benchmarks", "stub_schema.json")
+BASELINE = os.path.join(ROOT, "benchmarks", "pipeline_baseline.json")
+BENCHMARK_SPOILERS = 200
+# Spoiler logs are mostly locations and playthroughs, so pad the settings out to a realistic size
+SPOILER_PADDING = 5000
+
+# Some of the randomizer's disable rules, enough to give remove_redundant_settings real work
+STUB_DISABLE_RULES = {
+    "bridge": [["!tokens", ["bridge_tokens"]], ["!hearts", ["bridge_hearts"]], ["!medallions", ["bridge_medallions"]],
+               ["!stones", ["bridge_stones"]], ["!dungeons", ["bridge_rewards"]]],
+    "shuffle_ganon_bosskey": [["!tokens", ["ganon_bosskey_tokens"]], ["!hearts", ["ganon_bosskey_hearts"]],
+                              ["!medallions", ["ganon_bosskey_medallions"]], ["!stones", ["ganon_bosskey_stones"]],
+                              ["!dungeons", ["ganon_bosskey_rewards"]]],
+    "triforce_hunt": [[False, ["triforce_goal_per_world", "triforce_count_per_world"]]],
+    "trials_random": [[True, ["trials"]]],
+    "chicken_count_random": [[True, ["chicken_count"]]],
+    "big_poe_count_random": [[True, ["big_poe_count"]]],
+    "mq_dungeons_mode": [["!count", ["mq_dungeons_count"]], ["!specific", ["mq_dungeons_specific"]]],
+    "empty_dungeons_mode": [["!count", ["empty_dungeons_count"]], ["!specific", ["empty_dungeons_specific"]],
+                            ["!rewards", ["empty_dungeons_rewards"]]],
+    "key_rings_choice": [["off", ["key_rings"]], ["all", ["key_rings"]], ["random", ["key_rings"]]],
+    "silver_rupee_pouches_choice": [["off", ["silver_rupee_pouches"]], ["all", ["silver_rupee_pouches"]], ["random", ["silver_rupee_pouches"]]],
+    "dungeon_shortcuts_choice": [["off", ["dungeon_shortcuts"]], ["all", ["dungeon_shortcuts"]], ["random", ["dungeon_shortcuts"]]],
+    "correct_chest_appearances": [["off", ["chest_textures_specific"]]],
+    "correct_potcrate_appearances": [["off", ["potcrate_textures_specific"]]],
+}
+STUB_RANGES = {"bridge_tokens": (0, 100), "ganon_bosskey_tokens": (0, 100), "bridge_hearts": (4, 20), "ganon_bosskey_hearts": (4, 20),
+               "triforce_goal_per_world": (1, 100), "triforce_count_per_world": (1, 200)}
+STUB_STARTING_ITEMS = {
+    "inventory": {"deku_sticks": "Deku Sticks", "deku_nuts": "Deku Nuts", "bombs": "Bomb Bag", "bow": "Bow",
+                  "fire_arrows": "Fire Arrows", "dins_fire": "Dins Fire", "slingshot": "Slingshot", "ocarina": "Ocarina",
+                  "bombchus": "Bombchus", "hookshot": "Progressive Hookshot", "ice_arrows": "Ice Arrows", "farores_wind": "Farores Wind",
+                  "boomerang": "Boomerang", "lens": "Lens of Truth", "beans": "Magic Bean Pack", "megaton_hammer": "Megaton Hammer",
+                  "light_arrows": "Light Arrows", "nayrus_love": "Nayrus Love", "bottle": "Bottle", "rutos_letter": "Rutos Letter",
+                  "weird_egg": "Weird Egg", "chicken": "Chicken", "zeldas_letter": "Zeldas Letter", "keaton_mask": "Keaton Mask",
+                  "skull_mask": "Skull Mask", "spooky_mask": "Spooky Mask", "bunny_hood": "Bunny Hood", "goron_mask": "Goron Mask",
+                  "zora_mask": "Zora Mask", "gerudo_mask": "Gerudo Mask", "mask_of_truth": "Mask of Truth",
+                  "pocket_egg": "Pocket Egg", "pocket_cucco": "Pocket Cucco", "cojiro": "Cojiro", "odd_mushroom": "Odd Mushroom",
+                  "odd_potion": "Odd Potion", "poachers_saw": "Poachers Saw", "broken_sword": "Broken Sword",
+                  "prescription": "Prescription", "eyeball_frog": "Eyeball Frog", "eyedrops": "Eyedrops", "claim_check": "Claim Check"},
+    "songs": {"zeldas_lullaby": "Zeldas Lullaby", "eponas_song": "Eponas Song", "sarias_song": "Sarias Song", "suns_song": "Suns Song",
+              "song_of_time": "Song of Time", "song_of_storms": "Song of Storms", "minuet_of_forest": "Minuet of Forest",
+              "bolero_of_fire": "Bolero of Fire", "serenade_of_water": "Serenade of Water", "requiem_of_spirit": "Requiem of Spirit",
+              "nocturne_of_shadow": "Nocturne of Shadow", "prelude_of_light": "Prelude of Light"},
+    "equipment": {"kokiri_sword": "Kokiri Sword", "giants_knife": "Giants Knife", "biggoron_sword": "Biggoron Sword",
+                  "deku_shield": "Deku Shield", "hylian_shield": "Hylian Shield", "mirror_shield": "Mirror Shield",
+                  "goron_tunic": "Goron Tunic", "zora_tunic": "Zora Tunic", "iron_boots": "Iron Boots", "hover_boots": "Hover Boots",
+                  "magic": "Magic Meter", "strength": "Progressive Strength Upgrade", "scale": "Progressive Scale",
+                  "wallet": "Progressive Wallet", "stone_of_agony": "Stone of Agony", "defense": "Double Defense"},
+}
+# The parts of a randomizer hint distribution the conditionals edit
+STUB_HINT_DISTRIBUTION = {"always": {"copies": 1, "weight": 0}, "woth": {"copies": 1, "weight": 0}, "goal": {"copies": 1, "weight": 0},
+                          "barren": {"copies": 1, "weight": 0}, "sometimes": {"copies": 1, "weight": 0},
+                          "overworld": {"copies": 1, "weight": 0}, "dungeon": {"copies": 1, "weight": 0}, "song": {"copies": 1, "weight": 0}}
+
+
+def weights_files():
+    """ Every weights file in weights/ and the seasonal archive, skipping other JSON files there. """
+    files = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "weights", "*.json")) + glob.glob(os.path.join(ROOT, "weights", "rsl_seasonal_archive", "*.json"))):
+        with open(path) as fin:
+            data = json.load(fin)
+        if isinstance(data, dict) and "weights" in data:
+            files.append(path)
+    return files
+
+
+def build_stub_schema():
+    """ Build a stand-in for the randomizer's settings tables from every setting and option in the weights files. """
+    options = {}
+    for path in weights_files():
+        with open(path) as fin:
+            for setting, weights in json.load(fin)["weights"].items():
+                if isinstance(weights, dict):
+                    options.setdefault(setting, set()).update(weights)
+
+    settings = {}
+    for setting, choices in sorted(options.items()):
+        if choices <= {"true", "false"}:
+            settings[setting] = {"type": "bool", "choices": [True, False], "default": False}
+        elif all(choice.lstrip("-").isdigit() for choice in choices):
+            ints = sorted(int(choice) for choice in choices)
+            settings[setting] = {"type": "int", "choices": ints, "default": ints[0]}
+        else:
+            settings[setting] = {"type": "str", "choices": sorted(choices), "default": sorted(choices)[0]}
+    for setting, (low, high) in STUB_RANGES.items():
+        settings[setting] = {"type": "int", "choices": list(range(low, high + 1)), "default": low}
+    for setting, choices in ms_option_lookup.items():
+        settings[setting] = {"type": "list", "choices": list(choices), "default": []}
+    for setting in ["allowed_tricks", "disabled_locations", "starting_inventory", "starting_songs", "starting_equipment", "misc_hints"]:
+        settings.setdefault(setting, {"type": "list", "choices": [], "default": []})
+    settings["hint_dist_user"] = {"type": "dict", "choices": [], "default": {}}
+    settings["user_message"] = {"type": "str", "choices": [], "default": ""}
+    for setting, rules in STUB_DISABLE_RULES.items():
+        if setting in settings:
+            settings[setting]["disable"] = [[option, [other for other in disabled if other in settings]] for option, disabled in rules]
+
+    randomized = [setting for setting in settings if setting not in ("hint_dist_user", "user_message")]
+    return {
+        "format": settings_schema.SCHEMA_FORMAT,
+        "randomizer_commit": "stub",
+        "randomizer_version": "stub",
+        "settings": settings,
+        "tabs": {"main_tab": ["randomize_settings"] + randomized, "detailed_tab": [], "other_tab": [], "starting_tab": []},
+        "starting_items": STUB_STARTING_ITEMS,
+        "trade_items": ms_option_lookup["adult_trade_start"],
+        "child_trade_items": ms_option_lookup["shuffle_child_trade"],
+    }
+
+
+def write_stub_hint_distros(workdir, schema_data):
+    """ Give every hint_dist option a hint distribution file where the conditionals look for them. """
+    hints_dir = os.path.join(workdir, "randomizer", "data", "Hints")
+    os.makedirs(hints_dir, exist_ok=True)
+    for name in schema_data["settings"].get("hint_dist", {}).get("choices", []):
+        with open(os.path.join(hints_dir, f"{name}.json"), 'w') as fout:
+            json.dump({"name": name, "distribution": STUB_HINT_DISTRIBUTION, "misc_hint_items": {}}, fout)
+
+
+def load_profile(path):
+    """ Override files are merged on top of the RSL weights, like --override. """
+    if path.endswith("_override.json"):
+        return rs.WeightsProfile.load("RSL", path)
+    return rs.WeightsProfile.load(path)
+
+
+def throughput(func, seconds, rounds=5):
+    """ Calls of func per second over about the given time. The median of several rounds is kept,
+    so neither a round slowed down by something else running nor one sped up by a burst of
+    CPU time on a shared machine moves the result. """
+    rates = []
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0
+        while elapsed < seconds / rounds or calls == 0:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+        rates.append(calls / elapsed)
+    return statistics.median(rates)
+
+
+def bench_weights_file(profile, name, seconds, workdir):
+    """ Items per second of each pipeline stage for one weights profile. """
+    rng = seeded_rng("benchmark", name)
+    results = {}
+
+    def generate_plando():
+        rs.generate_plando(profile, False, "benchmark", rng=rng)
+    results["generate_plando"] = throughput(generate_plando, seconds)
+
+    def multiselects():
+        resolve_multiselects(profile.weight_multiselect, rng)
+    if profile.weight_multiselect:
+        results["resolve_multiselects"] = throughput(multiselects, seconds)
+
+    # Stages working on rolled settings cycle through copies of a fixed set of draws,
+    # since they edit the settings in place
+    draws = [rs.draw_base_settings(profile, rng=rng) for _ in range(100)]
+    draw_cycle = itertools.cycle(draws)
+
+    if profile.conditionals is not None:
+        def conditionals():
+            random_settings = {setting: list(value) if isinstance(value, list) else value for setting, value in next(draw_cycle).items()}
+            conds.parse_conditionals(profile.conditionals, rs.SeedWeights(profile, rng), random_settings, profile.new_start_with(), rng)
+        results["parse_conditionals"] = throughput(conditionals, seconds)
+
+    formatted_cycle = itertools.cycle([{setting: rs.format_setting_value(setting, value) for setting, value in draw.items()} for draw in draws])
+
+    def redundant():
+        rs.remove_redundant_settings(dict(next(formatted_cycle)))
+    results["remove_redundant_settings"] = throughput(redundant, seconds)
+
+    # Spoilers of rolled settings for the benchmark report
+    patches = os.path.join(workdir, "patches")
+    os.makedirs(patches, exist_ok=True)
+    padding = json.dumps({f"Location {i}": "Rupees (5)" for i in range(SPOILER_PADDING)}, indent=4)
+    for i in range(BENCHMARK_SPOILERS):
+        _, random_settings = rs.roll_valid_settings(profile, rng=rng)
+        with open(os.path.join(patches, f"OoTR_BENCH{i}_Spoiler.json"), 'w') as fout:
+            fout.write(f'{{":version": "stub", "settings": {json.dumps(random_settings, indent=4)}, "locations": {padding}}}')
+
+    def benchmark_weights():
+        # Without the cache, so every spoiler is read each time
+        cleanup(tools.BENCHMARK_CACHE_FILE)
+        tools.benchmark_weights(profile.weight_options, profile.weight_dict, profile.weight_multiselect, jobs=1)
+    results["benchmark_weights"] = throughput(benchmark_weights, seconds) * BENCHMARK_SPOILERS
+    shutil.rmtree(patches)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Print each throughput next to its baseline and return the stages that got slower than the tolerance allows. """
+    regressions = []
+    print(f"{'weights file':<44}{'stage':<28}{'per sec':>12}{'baseline':>12}{'change':>9}")
+    for name, stages in results.items():
+        for stage, rate in stages.items():
+            unit = "spoilers" if stage == "benchmark_weights" else "plandos"
+            base = baseline.get(name, {}).get(stage)
+            if base is None:
+                print(f"{name:<44}{stage:<28}{rate:>12.0f}{'-':>12}{'':>9}  {unit}")
+                continue
+            change = rate / base - 1
+            flag = ""
+            if change < -tolerance:
+                flag = "  SLOWER"
+                regressions.append((name, stage))
+            print(f"{name:<44}{stage:<28}{rate:>12.0f}{base:>12.0f}{change:>+9.0%}  {unit}{flag}")
+    return regressions
+
+
+def machine_info():
+    """ Where results were measured, saved with a baseline since throughput only compares on the same machine. """
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "date": datetime.date.today().isoformat(),
+    }
+
+
+def compare_skipped(skipped, baseline_skipped):
+    """ Print the weights files skipped now but not in the baseline, or the other way around, and
+    return whether there are any. A newly skipped file would otherwise just drop out of the comparison. """
+    newly_skipped = sorted(set(skipped) - set(baseline_skipped))
+    no_longer_skipped = sorted(set(baseline_skipped) - set(skipped))
+    for name in newly_skipped:
+        print(f"{name} is skipped but wasn't in the baseline")
+    for name in no_longer_skipped:
+        print(f"{name} was skipped in the baseline but isn't any more, save a new baseline")
+    return bool(newly_skipped or no_longer_skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.5, help="Minimum time to run each stage for in each pass.")
+    parser.add_argument("--passes", type=int, default=5, help="Times to measure every weights file; each stage keeps its median.")
+    # Stages of unchanged code measure up to about 25% slower between runs on a shared machine
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Report stages more than this fraction slower than the baseline.")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare against and save to.")
+    parser.add_argument("--save_baseline", action="store_true", help="Save these results as the new baseline.")
+    parser.add_argument("--rebuild_stub", action="store_true", help="Rebuild stub_schema.json from the weights files first.")
+    args = parser.parse_args()
+
+    if args.rebuild_stub or not os.path.isfile(STUB_SCHEMA):
+        with open(STUB_SCHEMA, 'w') as fout:
+            json.dump(build_stub_schema(), fout, indent=1)
+    with open(STUB_SCHEMA) as fin:
+        schema_data = json.load(fin)
+    settings_schema.set_schema(schema_data)
+
+    skipped = []
+    weights_root = os.path.join(ROOT, "weights")
+    workdir = tempfile.mkdtemp(prefix="rsl_benchmark_")
+    write_stub_hint_distros(workdir, schema_data)
+    cwd = os.getcwd()
+    rates = {}
+    try:
+        for _ in range(args.passes):
+            for path in weights_files():
+                name = os.path.relpath(path, weights_root).replace(os.sep, "/")
+                if name in skipped:
+                    continue
+                os.chdir(ROOT)
+                try:
+                    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                        profile = load_profile(path)
+                        # Plandos, caches and reports are written to the scratch directory
+                        os.chdir(workdir)
+                        for stage, rate in bench_weights_file(profile, name, args.seconds, workdir).items():
+                            rates.setdefault(name, {}).setdefault(stage, []).append(rate)
+                except Exception as ex:
+                    print(f"Skipping {name}: {ex!r}")
+                    skipped.append(name)
+                    rates.pop(name, None)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    # A slow stretch of a shared machine slows every stage measured during it, so each stage
+    # keeps its median over the passes instead of the rounds of a single pass
+    results = {name: {stage: statistics.median(stage_rates) for stage, stage_rates in stages.items()} for name, stages in rates.items()}
+
+    baseline = {"results": {}, "skipped": skipped}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)
+        machine = baseline["machine"]
+        print(f"Baseline from {machine['date']} on {machine['platform']}, {machine['processor']}, {machine['cpus']} cpus, Python {machine['python']}")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    same_machine = all(baseline.get("machine", {}).get(key) == value for key, value in machine_info().items() if key != "date")
+    skipped_changed = compare_skipped(skipped, baseline["skipped"])
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fout:
+            json.dump({"machine": machine_info(), "skipped": skipped, "results": results}, fout, indent=4)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+    if regressions:
+        print(f"{len(regressions)} stages are more than {args.tolerance:.0%} slower than the baseline")
+        if not same_machine:
+            # Throughput from another machine can't show a regression, save a baseline on this one
+            print("The baseline was made on a different machine, so slower stages don't fail the run")
+            regressions = []
+    if regressions or skipped_changed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
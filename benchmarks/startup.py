@@ -0,0 +1,75 @@
+""" Measure how long `RandomSettingsGenerator.py --no_seed` takes to roll one plando and exit.
+Run from the repository root: python benchmarks/startup.py [--runs N] [--target MS] """
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(command, runs):
+    """ Wall-clock times in milliseconds for running a command several times. """
+    times = []
+    outputs = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=ROOT, capture_output=True, encoding='utf-8')
+        times.append((time.perf_counter() - start) * 1000)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{completed.stdout}{completed.stderr}")
+        outputs.append(completed.stdout)
+    return times, outputs
+
+
+def slowest_imports(count=10):
+    """ The slowest cumulative imports of a plando-only run according to -X importtime. """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "RandomSettingsGenerator.py", "--no_seed"],
+                               cwd=ROOT, capture_output=True, encoding='utf-8')
+    rows = []
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.rstrip()))
+    cleanup_plandos([completed.stdout])
+    return sorted(rows, reverse=True)[:count]
+
+
+def cleanup_plandos(outputs):
+    """ Delete the plandos written by the timed runs. """
+    for output in outputs:
+        for line in output.splitlines():
+            if line.startswith("Plando File: "):
+                path = os.path.join(ROOT, "data", line[len("Plando File: "):])
+                if os.path.isfile(path):
+                    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10, help="Number of timed runs.")
+    parser.add_argument("--target", type=float, default=100, help="Startup target in milliseconds.")
+    args = parser.parse_args()
+
+    # Warm up bytecode caches and the schema snapshot before timing
+    _, outputs = time_command([sys.executable, "RandomSettingsGenerator.py", "--no_seed"], 1)
+    cleanup_plandos(outputs)
+
+    baseline, _ = time_command([sys.executable, "-c", "pass"], args.runs)
+    times, outputs = time_command([sys.executable, "RandomSettingsGenerator.py", "--no_seed"], args.runs)
+    cleanup_plandos(outputs)
+
+    median = statistics.median(times)
+    print(f"Interpreter only:    median {statistics.median(baseline):7.1f} ms, min {min(baseline):7.1f} ms")
+    print(f"Roll one plando:     median {median:7.1f} ms, min {min(times):7.1f} ms")
+    print(f"Generator overhead:  median {median - statistics.median(baseline):7.1f} ms")
+    print(f"Target {args.target:.0f} ms: {'met' if median <= args.target else 'NOT met'}")
+    print("\nSlowest imports (cumulative us):")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative:8d}  {name}")
+
+
+if __name__ == "__main__":
+    main()
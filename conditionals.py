@@ -8,11 +8,29 @@ from multiselects import ms_option_lookup
 from utils import geometric_weights, string_to_int
 
 
-def parse_conditionals(conditional_list, weight_dict, random_settings, extra_starting_items):
-    """ Parse the conditionals in the weights file to enable/disable them """
+# Hint distributions from randomizer/data/Hints, parsed once and shared by every seed in this process
+_hint_distro_cache = {}
+
+
+def load_hint_distro(distro):
+    """ Load a randomizer hint distribution, reading each file at most once per process.
+    The returned copy shares its contents with the cache except for the top level dict and
+    each hint type under 'distribution', which are the parts conditionals edit. """
+    if distro not in _hint_distro_cache:
+        with open(os.path.join('randomizer', 'data', 'Hints', distro+'.json')) as fin:
+            _hint_distro_cache[distro] = json.load(fin)
+    cached = _hint_distro_cache[distro]
+    distroin = {**cached}
+    distroin['distribution'] = {hint_type: {**details} for hint_type, details in cached['distribution'].items()}
+    return distroin
+
+
+def parse_conditionals(conditional_list, weight_dict, random_settings, extra_starting_items, rng=random):
+    """ Parse the conditionals in the weights file to enable/disable them.
+    weight_dict is the seed's SeedWeights: exclude options there and draw again rather than editing weights. """
     for cond, details in conditional_list.items():
         if details[0]:
-            getattr(sys.modules[__name__], cond)(random_settings, weight_dict=weight_dict, extra_starting_items=extra_starting_items, cparams=details[1:])
+            getattr(sys.modules[__name__], cond)(random_settings, weight_dict=weight_dict, extra_starting_items=extra_starting_items, cparams=details[1:], rng=rng)
 
 
 def constant_triforce_hunt_extras(random_settings, weight_dict, **kwargs):
@@ -22,20 +40,16 @@ def constant_triforce_hunt_extras(random_settings, weight_dict, **kwargs):
 
 def exclude_minimal_triforce_hunt(random_settings, weight_dict, **kwargs):
     """ If triforce hunt is enabled, reroll the item pool excluding minimal. """
-    weights = weight_dict['item_pool_value']
-    if 'minimal' in weights.keys() and random_settings['triforce_hunt'] == "true":
-        weights.pop('minimal')
-    random_settings['item_pool_value'] = random.choices(list(weights.keys()), weights=list(weights.values()))[0]
+    if random_settings['triforce_hunt'] == "true":
+        weight_dict.exclude('item_pool_value', 'minimal')
+    random_settings['item_pool_value'] = weight_dict.draw('item_pool_value')
 
 
 def exclude_ice_trap_misery(random_settings, weight_dict, **kwargs):
     """ If the damage multiplier is quad or OHKO, exclude ice trap onslaught and mayhem. """
-    weights = weight_dict['junk_ice_traps']
-    if 'mayhem' in weights.keys() and random_settings['damage_multiplier'] in ['quadruple', 'ohko']:
-        weights.pop('mayhem')
-    if 'onslaught' in weights.keys() and random_settings['damage_multiplier'] in ['quadruple', 'ohko']:
-        weights.pop('onslaught')
-    random_settings['junk_ice_traps'] = random.choices(list(weights.keys()), weights=list(weights.values()))[0]
+    if random_settings['damage_multiplier'] in ['quadruple', 'ohko']:
+        weight_dict.exclude('junk_ice_traps', 'mayhem', 'onslaught')
+    random_settings['junk_ice_traps'] = weight_dict.draw('junk_ice_traps')
 
 
 def disable_pot_chest_texture_independence(random_settings, **kwargs):
@@ -61,7 +75,7 @@ def disable_keysanity_independence(random_settings, **kwargs):
         # random_settings['shuffle_tcgkeys'] = random_settings['shuffle_smallkeys']
 
 
-def restrict_one_entrance_randomizer(random_settings, **kwargs):
+def restrict_one_entrance_randomizer(random_settings, rng=random, **kwargs):
     """ Ensure only a single pool is shuffled. If more than 1 is shuffled, randomly select one to keep and disable the rest. """
     erlist = ["shuffle_interior_entrances:off", "shuffle_grotto_entrances:false", "shuffle_dungeon_entrances:off", "shuffle_overworld_entrances:false"]
 
@@ -75,7 +89,7 @@ def restrict_one_entrance_randomizer(random_settings, **kwargs):
     # If too many are enabled, chose one to keep on
     if len(enabled_er) < 2:
         return
-    keepon = random.choice(enabled_er).split(":")[0]
+    keepon = rng.choice(enabled_er).split(":")[0]
 
     # Turn the rest off
     for item in erlist:
@@ -90,19 +104,18 @@ def random_scrubs_start_wallet(random_settings, weight_dict, extra_starting_item
         extra_starting_items['starting_equipment'] += ['wallet']
 
 
-def shuffle_goal_hints(random_settings, **kwargs):
+def shuffle_goal_hints(random_settings, rng=random, **kwargs):
     """ Swaps Way of the Hero hints with Goal hints. Takes an extra input [how often to swap] """
     chance_of_goals = string_to_int(kwargs['cparams'][0])
     current_distro = random_settings['hint_dist']
 
     # Roll to swap goal hints
-    goals = random.choices([True, False], weights=[chance_of_goals, 100-chance_of_goals])[0]
+    goals = rng.choices([True, False], weights=[chance_of_goals, 100-chance_of_goals])[0]
     if not goals or current_distro == 'useless':
         return
 
     # Load the distro
-    with open(os.path.join('randomizer', 'data', 'Hints', current_distro+'.json')) as fin:
-        distroin = json.load(fin)
+    distroin = load_hint_distro(current_distro)
 
     # Perform the swap
     woth = {**distroin['distribution']['woth']}
@@ -116,13 +129,12 @@ def replace_dampe_diary_hint_with_lightarrow(random_settings, **kwargs):
     current_distro = random_settings['hint_dist']
 
     # Load the distro and change the misc hint
-    with open(os.path.join('randomizer', 'data', 'Hints', current_distro+'.json')) as fin:
-        distroin = json.load(fin)
+    distroin = load_hint_distro(current_distro)
     distroin['misc_hint_items'] = {'dampe_diary': "Light Arrows"}
     random_settings['hint_dist_user'] = distroin
 
 
-def split_collectible_bridge_conditions(random_settings, **kwargs):
+def split_collectible_bridge_conditions(random_settings, rng=random, **kwargs):
     """ Split heart and skulltula token bridge and ganon boss key.
     kwargs: [how often to have a heart or skull bridge, "heart%/skull%", "bridge%/gbk%/both"]
     """
@@ -131,15 +143,15 @@ def split_collectible_bridge_conditions(random_settings, **kwargs):
     weights = [int(x) for x in kwargs['cparams'][2].split('/')]
 
     # Roll for collectible win condition
-    skull_wincon = random.choices([True, False], weights=[chance_of_collectible_wincon, 100-chance_of_collectible_wincon])[0]
+    skull_wincon = rng.choices([True, False], weights=[chance_of_collectible_wincon, 100-chance_of_collectible_wincon])[0]
     if not skull_wincon:
         return
 
     # Roll for hearts or skulls
-    condition = random.choices(["hearts", "tokens"], weights=typeweights)[0]
+    condition = rng.choices(["hearts", "tokens"], weights=typeweights)[0]
 
     # Roll for bridge/bosskey/both
-    whichtype = random.choices(['bridge', 'gbk', 'both'], weights=weights)[0]
+    whichtype = rng.choices(['bridge', 'gbk', 'both'], weights=weights)[0]
     if whichtype in ['bridge', 'both']:
         random_settings['bridge'] = condition
     if whichtype in ['gbk', 'both']:
@@ -162,8 +174,7 @@ def adjust_chaos_hint_distro(random_settings, **kwargs):
         if not current_distro == "chaos":
             print("Not using the chaos distribution, passing...")
             return
-        with open(os.path.join('randomizer', 'data', 'Hints', current_distro+'.json')) as fin:
-            distroin = json.load(fin)
+        distroin = load_hint_distro(current_distro)
 
     # Make changes and save
     distroin['distribution']['always']['copies'] = 2
@@ -176,10 +187,9 @@ def adjust_chaos_hint_distro(random_settings, **kwargs):
 
 def exclude_mapcompass_info_remove(random_settings, weight_dict, **kwargs):
     """ If Maps and Compai give info, do not allow them to be removed """
-    weights = weight_dict['shuffle_mapcompass']
-    if 'remove' in weights.keys() and random_settings['enhance_map_compass'] == "true":
-        weights.pop('remove')
-    random_settings['shuffle_mapcompass'] = random.choices(list(weights.keys()), weights=list(weights.values()))[0]
+    if random_settings['enhance_map_compass'] == "true":
+        weight_dict.exclude('shuffle_mapcompass', 'remove')
+    random_settings['shuffle_mapcompass'] = weight_dict.draw('shuffle_mapcompass')
 
 
 
@@ -188,7 +198,7 @@ def ohko_starts_with_nayrus(random_settings, weight_dict, extra_starting_items,
     if random_settings['damage_multiplier'] == 'ohko':
         extra_starting_items['starting_inventory'] += ['nayrus_love']
 
-def invert_dungeons_mq_count(random_settings, weight_dict, **kwargs):
+def invert_dungeons_mq_count(random_settings, weight_dict, rng=random, **kwargs):
     """ When activated will invert the MQ dungeons count
         kwargs: [chance of having the MQ count inverted]
     """
@@ -196,7 +206,7 @@ def invert_dungeons_mq_count(random_settings, weight_dict, **kwargs):
         return
 
     chance_of_inverting_mq_count = string_to_int(kwargs['cparams'][0])
-    invert_mq_count = random.choices([True, False], weights=[chance_of_inverting_mq_count, 100-chance_of_inverting_mq_count])[0]
+    invert_mq_count = rng.choices([True, False], weights=[chance_of_inverting_mq_count, 100-chance_of_inverting_mq_count])[0]
 
     if not invert_mq_count:
         return
@@ -213,45 +223,45 @@ def shuffle_valley_lake_exit(random_settings, **kwargs):
         random_settings['shuffle_gerudo_valley_river_exit'] = "true"
 
 
-def select_one_pots_crates_freestanding(random_settings, **kwargs):
+def select_one_pots_crates_freestanding(random_settings, rng=random, **kwargs):
     chance_one_is_on = string_to_int(kwargs['cparams'][0])
     setting_weights = [int(x) for x in kwargs['cparams'][1].split('/')]
     weights = [int(x) for x in kwargs['cparams'][2].split('/')]
 
     # If setting is randomized off, return
-    if not (random.randint(0, 100) < chance_one_is_on):
+    if not (rng.randint(0, 100) < chance_one_is_on):
        return
 
     # Choose which of the settings to turn on
-    setting = random.choices(["shuffle_pots", "shuffle_crates", "shuffle_freestanding_items"], weights=setting_weights)[0]
-    random_settings[setting] = random.choices(["overworld", "dungeons", "all"], weights=weights)[0]
+    setting = rng.choices(["shuffle_pots", "shuffle_crates", "shuffle_freestanding_items"], weights=setting_weights)[0]
+    random_settings[setting] = rng.choices(["overworld", "dungeons", "all"], weights=weights)[0]
 
 
-def geometrically_draw_dungeon_shortcuts(random_settings, **kwargs):
+def geometrically_draw_dungeon_shortcuts(random_settings, rng=random, **kwargs):
     nunique = len(ms_option_lookup["dungeon_shortcuts"])
-    chooseN = random.choices(range(nunique+1), weights=geometric_weights(nunique+1))[0]
-    random_settings["dungeon_shortcuts"] = random.sample(ms_option_lookup["dungeon_shortcuts"], chooseN)
+    chooseN = rng.choices(range(nunique+1), weights=geometric_weights(nunique+1))[0]
+    random_settings["dungeon_shortcuts"] = rng.sample(ms_option_lookup["dungeon_shortcuts"], chooseN)
 
 
-def limit_overworld_entrances_in_mixed_entrance_pools(random_settings, **kwargs):
+def limit_overworld_entrances_in_mixed_entrance_pools(random_settings, rng=random, **kwargs):
     if len(random_settings["mix_entrance_pools"]) < 1:
         return
 
     # Decide if overworld should be included
     overworld_probability = string_to_int(kwargs['cparams'][0])
-    includeOverworld = random.random()*100 < overworld_probability
+    includeOverworld = rng.choices([True, False], weights=[overworld_probability, 100-overworld_probability])[0]
     # If needed, remove overworld from mixed pools
     if not includeOverworld and "Overworld" in random_settings["mix_entrance_pools"]:
         random_settings["mix_entrance_pools"].remove("Overworld")
 
 
-def limit_mixed_pool_entrances(random_settings, **kwargs):
+def limit_mixed_pool_entrances(random_settings, rng=random, **kwargs):
     max_mixed = int(kwargs['cparams'][0])
     omit_overworld = bool(kwargs['cparams'][1])
     if omit_overworld and "Overworld" in random_settings["mix_entrance_pools"]:
         random_settings["mix_entrance_pools"].remove("Overworld")
     if len(random_settings["mix_entrance_pools"]) > max_mixed:
-        random_settings["mix_entrance_pools"] = random.sample(random_settings["mix_entrance_pools"], max_mixed)
+        random_settings["mix_entrance_pools"] = rng.sample(random_settings["mix_entrance_pools"], max_mixed)
 
 
 def keysanity_key_get_keyrings(random_settings, **kwargs):
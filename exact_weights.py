@@ -0,0 +1,296 @@
+""" Exact rates of every setting option for a weights file, without rolling any seeds.
+Most settings only interact with a few others, through a conditional or through one setting
+disabling another. The settings that can affect a setting are collected from the conditionals'
+reads and writes and the randomizer's disable rules, and every combination of their draws is
+walked once through the same steps as roll_settings.roll_random_settings, so the rates are
+exact rather than sampled. """
+import time
+import itertools
+import conditionals as conds
+import roll_settings as rs
+import rsl_tools as tools
+from multiselects import ms_option_lookup, invalid_settings
+from settings_schema import get_schema
+
+# Components with more combinations than this are left out of the report
+EXACT_MAX_OUTCOMES = 200000
+EXACT_REPORT = "weights_exact_report.html"
+STARTING_ITEM_SETTINGS = ["starting_inventory", "starting_songs", "starting_equipment"]
+
+# The settings each conditional reads and writes. A conditional has to be listed here to be
+# used with the exact engine.
+CONDITIONAL_DEPENDENCIES = {
+    "constant_triforce_hunt_extras": (["triforce_goal_per_world"], ["triforce_count_per_world"]),
+    "exclude_minimal_triforce_hunt": (["triforce_hunt"], ["item_pool_value"]),
+    "exclude_ice_trap_misery": (["damage_multiplier"], ["junk_ice_traps"]),
+    "disable_pot_chest_texture_independence": (["correct_chest_appearances"], ["correct_potcrate_appearances"]),
+    "disable_keysanity_independence": (["shuffle_smallkeys"], ["shuffle_hideoutkeys"]),
+    "restrict_one_entrance_randomizer": (["shuffle_interior_entrances", "shuffle_grotto_entrances", "shuffle_dungeon_entrances", "shuffle_overworld_entrances"],
+                                         ["shuffle_interior_entrances", "shuffle_grotto_entrances", "shuffle_dungeon_entrances", "shuffle_overworld_entrances"]),
+    "random_scrubs_start_wallet": (["shuffle_scrubs"], ["starting_equipment"]),
+    "shuffle_goal_hints": (["hint_dist"], ["hint_dist_user"]),
+    "replace_dampe_diary_hint_with_lightarrow": (["hint_dist"], ["hint_dist_user"]),
+    "split_collectible_bridge_conditions": ([], ["bridge", "shuffle_ganon_bosskey"]),
+    "adjust_chaos_hint_distro": (["hint_dist", "hint_dist_user"], ["hint_dist_user"]),
+    "exclude_mapcompass_info_remove": (["enhance_map_compass"], ["shuffle_mapcompass"]),
+    "ohko_starts_with_nayrus": (["damage_multiplier"], ["starting_inventory"]),
+    "invert_dungeons_mq_count": (["mq_dungeons_mode", "mq_dungeons_count"], ["mq_dungeons_count"]),
+    "shuffle_valley_lake_exit": (["shuffle_overworld_entrances", "owl_drops"], ["shuffle_gerudo_valley_river_exit"]),
+    "select_one_pots_crates_freestanding": ([], ["shuffle_pots", "shuffle_crates", "shuffle_freestanding_items"]),
+    "geometrically_draw_dungeon_shortcuts": ([], ["dungeon_shortcuts"]),
+    "limit_overworld_entrances_in_mixed_entrance_pools": (["mix_entrance_pools"], ["mix_entrance_pools"]),
+    "limit_mixed_pool_entrances": (["mix_entrance_pools"], ["mix_entrance_pools"]),
+    "keysanity_key_get_keyrings": (["shuffle_smallkeys"], ["key_rings"]),
+}
+
+
+class EnumeratingRandom:
+    """ Stands in for random.Random and walks every combination of outcomes of the draws made
+    through it. Run the same function once per path, calling next_path in between, until
+    next_path returns False. probability() is the chance of the current path. Samples are
+    walked as combinations, so sampled lists come back in population order. """
+
+    def __init__(self):
+        self._draws = []  # [probabilities, chosen index] for each draw on the current path
+        self._depth = 0
+
+    def _draw(self, probabilities):
+        if self._depth == len(self._draws):
+            self._draws.append([probabilities, next(i for i, p in enumerate(probabilities) if p > 0)])
+        index = self._draws[self._depth][1]
+        self._depth += 1
+        return index
+
+    def probability(self):
+        probability = 1.0
+        for probabilities, index in self._draws:
+            probability *= probabilities[index]
+        return probability
+
+    def next_path(self):
+        """ Move on to the next combination of outcomes, returning False after the last one. """
+        self._depth = 0
+        while self._draws:
+            probabilities, index = self._draws[-1]
+            index = next((i for i in range(index + 1, len(probabilities)) if probabilities[i] > 0), None)
+            if index is not None:
+                self._draws[-1][1] = index
+                return True
+            self._draws.pop()
+        return False
+
+    def pick(self, weights):
+        """ Draw an index with the given weights. """
+        total = sum(weights)
+        return self._draw([weight / total for weight in weights])
+
+    def choices(self, population, weights=None, k=1):
+        if k != 1:
+            raise NotImplementedError("EnumeratingRandom only draws one choice at a time")
+        return [population[self.pick(weights if weights is not None else [1] * len(population))]]
+
+    def choice(self, seq):
+        return seq[self.pick([1] * len(seq))]
+
+    def randint(self, a, b):
+        return a + self.pick([1] * (b - a + 1))
+
+    def sample(self, population, k):
+        population = list(population)
+        combinations = list(itertools.combinations(range(len(population)), k))
+        return [population[i] for i in combinations[self.pick([1] * len(combinations))]]
+
+    def random(self):
+        raise NotImplementedError("Continuous draws can't be enumerated, draw with choices instead")
+
+
+class ExactSeedWeights:
+    """ roll_settings.SeedWeights for an EnumeratingRandom. """
+
+    def __init__(self, profile, rng):
+        self.profile = profile
+        self.rng = rng
+        self._excluded = {}
+
+    def exclude(self, setting, *options):
+        self._excluded.setdefault(setting, set()).update(options)
+
+    def draw(self, setting):
+        sampler = self.profile.sampler(setting).without(self._excluded.get(setting, ()))
+        return sampler.options[self.rng.pick(sampler.weights)]
+
+
+class ExactEngine:
+    """ Exact option rates for one WeightsProfile. Components of settings that can affect each
+    other are enumerated once and shared by every setting in them. """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.index = rs.get_disable_index()
+        self.conditionals = []
+        if profile.conditionals is not None:
+            for cond, details in profile.conditionals.items():
+                if not details[0]:
+                    continue
+                if cond not in CONDITIONAL_DEPENDENCIES:
+                    raise NotImplementedError(f"Conditional {cond} has no entry in exact_weights.CONDITIONAL_DEPENDENCIES")
+                self.conditionals.append((cond, list(details[1:])))
+
+        # Every setting a plando can have, in the order roll_random_settings adds them
+        self.order = list(profile.settings())
+        if profile.weight_multiselect is not None:
+            self.order += [setting for setting in invalid_settings + list(ms_option_lookup) if setting not in self.order]
+        for cond, _ in self.conditionals:
+            self.order += [setting for setting in CONDITIONAL_DEPENDENCIES[cond][1] if setting not in self.order]
+        self.constants = {}
+        weight_options = profile.weight_options
+        if profile.has_options:
+            if "tricks" in weight_options:
+                self.constants["allowed_tricks"] = list(weight_options["tricks"])
+            if "disabled_locations" in weight_options:
+                self.constants["disabled_locations"] = list(weight_options["disabled_locations"])
+            self.constants["misc_hints"] = list(weight_options["misc_hints"]) if "misc_hints" in weight_options else []
+        self.order += [setting for setting in self.constants if setting not in self.order]
+
+        # The settings whose value can decide whether each setting is disabled
+        schema = get_schema()
+        self.disablers = {}
+        for setting, info in schema.setting_infos.items():
+            if info.disable is None:
+                continue
+            for disabling in info.disable.values():
+                for other_setting in disabling.get('settings', []):
+                    self.disablers.setdefault(other_setting, set()).add(setting)
+        self.writers = {}
+        for cond, _ in self.conditionals:
+            for setting in CONDITIONAL_DEPENDENCIES[cond][1]:
+                self.writers.setdefault(setting, []).append(cond)
+        self._rates = {}
+
+    def component(self, setting):
+        """ Every setting that can change the final value of a setting, including itself. """
+        component = {setting}
+        queue = [setting]
+        while queue:
+            current = queue.pop()
+            depends_on = set(self.disablers.get(current, ()))
+            if current in rs.RANDOM_PLANDO_SETTINGS:
+                depends_on.add(current + '_random')
+            for cond in self.writers.get(current, []):
+                reads, writes = CONDITIONAL_DEPENDENCIES[cond]
+                depends_on.update(reads)
+            for other_setting in depends_on:
+                if other_setting not in component and other_setting in self.order:
+                    component.add(other_setting)
+                    queue.append(other_setting)
+        return component
+
+    def outcome_count(self, component):
+        """ An estimate of how many paths enumerating a component walks. """
+        count = 1
+        for setting in component:
+            if setting in self.profile.settings():
+                count *= len(self.profile.options(setting))
+            elif self.profile.weight_multiselect is not None and setting in ms_option_lookup and setting not in invalid_settings:
+                count *= 2
+        return count
+
+    def _roll_component(self, component, rng):
+        """ roll_settings.roll_random_settings, for only the settings of one component. """
+        profile = self.profile
+        random_settings = {}
+        for setting in profile.settings():
+            if setting in component:
+                random_settings[setting] = profile.options(setting)[rng.pick(profile.sampler(setting).weights)]
+        if profile.weight_multiselect is not None:
+            for setting in invalid_settings:
+                if setting in component:
+                    random_settings[setting] = []
+            for setting, options in ms_option_lookup.items():
+                if setting in component and setting not in invalid_settings:
+                    percent = profile.weight_multiselect[setting]
+                    enabled = rng.choices([True, False], weights=[percent, 100 - percent])[0] if 0 < percent < 100 else percent >= 100
+                    random_settings[setting] = list(options) if enabled else []
+
+        seed_weights = ExactSeedWeights(profile, rng)
+        start_with = {key: [] for key in STARTING_ITEM_SETTINGS}
+        for cond, cparams in self.conditionals:
+            if component.intersection(CONDITIONAL_DEPENDENCIES[cond][1]):
+                getattr(conds, cond)(random_settings, weight_dict=seed_weights, extra_starting_items=start_with, cparams=cparams, rng=rng)
+        for setting, value in self.constants.items():
+            if setting in component:
+                random_settings[setting] = list(value)
+
+        for setting in rs.RANDOM_PLANDO_SETTINGS:
+            if setting in random_settings and random_settings.get(setting + '_random') == "true":
+                random_settings.pop(setting)
+        for setting, value in random_settings.items():
+            random_settings[setting] = rs.format_setting_value(setting, value)
+        rs.remove_redundant_settings(random_settings)
+        return random_settings
+
+    def _enumerate(self, component):
+        rates = {setting: {} for setting in component}
+        rng = EnumeratingRandom()
+        while True:
+            random_settings = self._roll_component(component, rng)
+            probability = rng.probability()
+            for setting in component:
+                if setting in random_settings:
+                    value = tools.format_setting_option(random_settings[setting])
+                    if isinstance(value, list):
+                        value = tuple(value)
+                    rates[setting][value] = rates[setting].get(value, 0.0) + probability
+            if not rng.next_path():
+                break
+        for setting, values in rates.items():
+            self._rates[setting] = values
+
+    def rates(self, setting):
+        """ {value: probability} for a setting's final value, with list values as tuples. The
+        chance the setting is left out of the plando is 1 minus the sum. Returns None if the
+        setting's component is too large to enumerate. """
+        if setting not in self._rates:
+            component = self.component(setting)
+            if self.outcome_count(component) > EXACT_MAX_OUTCOMES:
+                return None
+            if any(key in component and self.index.has_rules(key) for key in STARTING_ITEM_SETTINGS):
+                raise NotImplementedError("Starting items that disable other settings are not supported by the exact engine")
+            self._enumerate(component)
+        return self._rates[setting]
+
+
+def exact_weights(profile):
+    """ Write the --benchmark report for a WeightsProfile from exact option rates. """
+    start_time = time.perf_counter()
+    engine = ExactEngine(profile)
+    targets = list(profile.weight_dict) + [setting for setting in (profile.weight_multiselect or ()) if setting not in profile.weight_dict]
+    # Enumerate the largest components first, so that settings inside them come for free
+    components = {setting: engine.component(setting) for setting in targets if setting in engine.order}
+    setting_values = []
+    skipped = []
+    for setting in sorted(components, key=lambda s: -len(components[s])):
+        rates = engine.rates(setting)
+        if rates is None:
+            skipped.append(setting)
+            continue
+        for value, probability in rates.items():
+            setting_values.append((setting, list(value) if isinstance(value, tuple) else value, probability))
+    elapsed = time.perf_counter() - start_time
+    print(f"RSL GENERATOR: COMPUTED EXACT RATES FOR {len(components) - len(skipped)} SETTINGS IN {elapsed * 1000:.0f} MS")
+    if skipped:
+        print(f"RSL GENERATOR: SKIPPED SETTINGS WITH MORE THAN {EXACT_MAX_OUTCOMES} COMBINATIONS TO CHECK: {', '.join(skipped)}")
+
+    settings_counts, geometric_multis = tools.init_settings_counts(profile.weight_options, profile.weight_dict, profile.weight_multiselect)
+    for setting in skipped:
+        settings_counts.pop(setting, None)
+    tools.tally_settings_counts(settings_counts, geometric_multis, 1, setting_values, intervals=False)
+    # Counts out of one seed are probabilities, round away float noise for the report
+    for setting_name, setting_options in settings_counts.items():
+        for setting_option, option_data in setting_options.items():
+            if setting_option == 'disabled_seeds':
+                setting_options[setting_option] = round(option_data, 12)
+            else:
+                for key in ["total_seeds", "fraction_seeds"]:
+                    option_data[key] = round(option_data[key], 12)
+    tools.write_weights_report(settings_counts, 1, EXACT_REPORT, "Random Settings Weights Exact Rates", summary="Exact rates: Total Seeds is the chance of each option in one seed")
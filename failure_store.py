@@ -0,0 +1,125 @@
+""" An append-only SQLite store of the plandos the randomizer was run with. Failed plandos are kept
+with the randomizer's log, compressed, instead of as loose file pairs in failed_settings. The
+settings of failed plandos, and of successful ones during stress tests, are indexed so failures
+can be broken down by setting value, and failures are indexed by a normalized error signature. """
+import os
+import re
+import json
+import zlib
+import sqlite3
+import datetime
+from contextlib import closing
+from randomizer_errors import classify_failure
+
+FAILURE_STORE = os.path.join('failed_settings', 'failures.sqlite3')
+# Seconds to wait for other --jobs processes writing to the store at the same time
+STORE_TIMEOUT = 30
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plandos (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    created TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    failure TEXT,
+    signature TEXT,
+    plando BLOB,
+    stderr BLOB
+);
+CREATE TABLE IF NOT EXISTS plando_settings (
+    plando_id INTEGER NOT NULL REFERENCES plandos(id),
+    setting TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plandos_signature ON plandos(signature);
+CREATE INDEX IF NOT EXISTS plando_settings_value ON plando_settings(setting, value, plando_id);
+"""
+
+# The last line of a traceback, e.g. "FillError: Game unbeatable: ..."
+_exception_line = re.compile(r"^(?:[\w.]+(?:Error|Exception|Exit)\b|Exception\b).*$", re.MULTILINE)
+_numbers = re.compile(r"\b(?:0x[0-9a-fA-F]+|\d+)\b")
+
+
+def error_signature(stderr):
+    """ The error a failed run ended with, with numbers replaced so that the same error from
+    different seeds has the same signature. """
+    lines = _exception_line.findall(stderr)
+    if lines:
+        line = lines[-1]
+    else:
+        lines = [line for line in stderr.splitlines() if line.strip()]
+        line = lines[-1] if lines else ""
+    return _numbers.sub("#", line.strip())
+
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=STORE_TIMEOUT)
+    # Lets several processes add entries while the store is being read
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(STORE_SCHEMA)
+    return conn
+
+
+def record(plando, filename, success, stderr=None, path=FAILURE_STORE):
+    """ Add a plando the randomizer was run with. Failed plandos are kept along with the log. """
+    failure = signature = plando_blob = stderr_blob = None
+    if not success:
+        failure, _ = classify_failure(stderr)
+        signature = error_signature(stderr)
+        plando_blob = zlib.compress(json.dumps(plando).encode('utf-8'))
+        stderr_blob = zlib.compress(stderr.encode('utf-8'))
+    created = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    with closing(_connect(path)) as conn, conn:
+        cursor = conn.execute("INSERT INTO plandos (filename, created, success, failure, signature, plando, stderr) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (filename, created, int(success), failure, signature, plando_blob, stderr_blob))
+        conn.executemany("INSERT INTO plando_settings VALUES (?, ?, ?)",
+                         ((cursor.lastrowid, setting, json.dumps(value)) for setting, value in plando["settings"].items()))
+
+
+def failure_rates(setting, path=FAILURE_STORE):
+    """ (value, plandos, failures) for every value of a setting the randomizer was run with. """
+    with closing(_connect(path)) as conn:
+        return conn.execute("SELECT s.value, COUNT(*), SUM(1 - p.success) FROM plando_settings s JOIN plandos p ON p.id = s.plando_id "
+                            "WHERE s.setting = ? GROUP BY s.value ORDER BY COUNT(*) DESC", (setting,)).fetchall()
+
+
+def failure_signatures(path=FAILURE_STORE):
+    """ (failure class, signature, failures) for every error signature, most common first. """
+    with closing(_connect(path)) as conn:
+        return conn.execute("SELECT failure, signature, COUNT(*) FROM plandos WHERE success = 0 "
+                            "GROUP BY failure, signature ORDER BY COUNT(*) DESC").fetchall()
+
+
+def print_failure_rates(setting, path=FAILURE_STORE):
+    rows = failure_rates(setting, path)
+    if not rows:
+        print(f"RSL GENERATOR: NO PLANDOS WITH {setting} IN {path}")
+        return
+    print(f"{'value':<40}{'plandos':>10}{'failures':>10}{'rate':>9}")
+    for value, plandos, failures in rows:
+        print(f"{value:<40}{plandos:>10}{failures:>10}{failures / plandos:>9.1%}")
+
+
+def print_failure_signatures(path=FAILURE_STORE):
+    rows = failure_signatures(path)
+    if not rows:
+        print(f"RSL GENERATOR: NO FAILURES IN {path}")
+        return
+    for failure, signature, count in rows:
+        print(f"{count:>8}  {failure:<20}{signature}")
+
+
+def export_failures(directory='failed_settings', path=FAILURE_STORE):
+    """ Write every failed plando and its log as <plando>.json and <plando>.json_errlog, the way
+    failed_settings used to hold them. """
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    with closing(_connect(path)) as conn:
+        for filename, plando_blob, stderr_blob in conn.execute("SELECT filename, plando, stderr FROM plandos WHERE success = 0 ORDER BY id"):
+            with open(os.path.join(directory, filename), 'w') as fout:
+                json.dump(json.loads(zlib.decompress(plando_blob)), fout, indent=4)
+            with open(os.path.join(directory, filename + '_errlog'), 'w') as fout:
+                fout.write(zlib.decompress(stderr_blob).decode('utf-8'))
+            count += 1
+    print(f"RSL GENERATOR: EXPORTED {count} FAILED PLANDOS TO {directory}")
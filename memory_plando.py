@@ -0,0 +1,32 @@
+""" Hands a plando to the randomizer without writing it to disk. The plando is put in an
+anonymous in-memory file (Linux memfd) and the randomizer's distribution_file points at it
+through /proc/self/fd, so the randomizer reads it like any other plando file. A subprocess
+inherits the file, and a warm worker makes its own. """
+import os
+import json
+from contextlib import contextmanager
+
+
+def supported():
+    """ Whether in-memory plandos can be used on this system. """
+    return hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd")
+
+
+@contextmanager
+def handoff(settings_json, plando_json):
+    """ Settings for an attempt whose distribution_file is plando_json held in memory, and the
+    file descriptors a randomizer subprocess has to inherit. Without a plando_json, the settings
+    are used as they are. """
+    if plando_json is None:
+        yield settings_json, ()
+        return
+    fd = os.memfd_create("rsl_plando")
+    try:
+        with open(fd, 'w', encoding='utf-8', closefd=False) as fout:
+            fout.write(plando_json)
+        settings = json.loads(settings_json)
+        # Opening the /proc path reads the file from the start, however often the randomizer opens it
+        settings["distribution_file"] = f"/proc/self/fd/{fd}"
+        yield json.dumps(settings), (fd,)
+    finally:
+        os.close(fd)
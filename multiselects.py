@@ -69,15 +69,16 @@ def _validate_ms_weights(ms_weights):
             raise Exception(f"Randomizing {setting} is not supported.")
 
 
-def resolve_multiselects(ms_weights):
+def resolve_multiselects(ms_weights, rng=random):
     randomized_ms = { setting: [] for setting in invalid_settings }
     _validate_ms_weights(ms_weights)
 
     for setting, options in ms_option_lookup.items():
         if setting in invalid_settings:
             continue
-        if random.random()*100 < ms_weights[setting]:
-            randomized_ms[setting] = options
+        if rng.random()*100 < ms_weights[setting]:
+            # Copy so that conditionals editing this seed's list don't change the lookup
+            randomized_ms[setting] = list(options)
         else:
             randomized_ms[setting] = []
 
@@ -0,0 +1,43 @@
+""" Classify randomizer failures and map them to the settings most likely responsible, so a
+failed plando can be partially rerolled instead of thrown away. """
+import re
+
+# Added to the log of an attempt that randomizer_runner killed for running too long
+RANDOMIZER_TIMEOUT_MESSAGE = "RSL GENERATOR: RANDOMIZER TIMED OUT"
+
+ENTRANCE_SETTINGS = [
+    "shuffle_interior_entrances", "shuffle_hideout_entrances", "shuffle_grotto_entrances", "shuffle_dungeon_entrances",
+    "shuffle_bosses", "shuffle_ganon_tower", "shuffle_overworld_entrances", "shuffle_gerudo_valley_river_exit",
+    "owl_drops", "warp_songs", "spawn_positions", "mix_entrance_pools", "decouple_entrances",
+]
+
+FILL_SETTINGS = [
+    "item_pool_value", "shuffle_smallkeys", "shuffle_hideoutkeys", "shuffle_tcgkeys", "shuffle_bosskeys",
+    "shuffle_ganon_bosskey", "shuffle_silver_rupees", "shuffle_mapcompass", "key_rings", "silver_rupee_pouches",
+    "shuffle_song_items", "shopsanity", "tokensanity", "shuffle_scrubs", "shuffle_pots", "shuffle_crates",
+    "shuffle_freestanding_items", "shuffle_cows", "shuffle_beehives", "shuffle_frog_song_rupees",
+    "shuffle_individual_ocarina_notes", "shuffle_loach_reward", "shuffle_child_trade", "adult_trade_start",
+    "open_forest", "open_kakariko", "open_door_of_time", "zora_fountain", "gerudo_fortress", "starting_age",
+    "mq_dungeons_mode", "mq_dungeons_count", "empty_dungeons_mode", "empty_dungeons_count",
+]
+
+# (failure class, pattern found in the randomizer's stderr, settings to reroll). Checked in order,
+# so entrance failures, which also tend to mention placing things, are recognized first.
+# Attempts killed for running too long or using too much memory can't be pinned on any settings.
+FAILURE_CLASSES = [
+    ("timeout", re.compile(re.escape(RANDOMIZER_TIMEOUT_MESSAGE)), None),
+    ("out_of_memory", re.compile(r"MemoryError"), None),
+    ("entrance_placement", re.compile(r"EntranceShuffleError|Entrance placement|entrance shuffle", re.IGNORECASE), ENTRANCE_SETTINGS),
+    ("unplaceable_item", re.compile(r"Could not place|No more spots|No locations to place", re.IGNORECASE), FILL_SETTINGS),
+    ("fill_failure", re.compile(r"FillError|Game unbeatable|not beatable", re.IGNORECASE), FILL_SETTINGS),
+]
+
+
+def classify_failure(stderr):
+    """ The failure class of a failed randomizer run and the settings likely responsible for it.
+    Failures that aren't recognized give ("unknown", None), meaning every setting is suspect.
+    Timeouts and running out of memory are recognized but also give no settings. """
+    for name, pattern, settings in FAILURE_CLASSES:
+        if pattern.search(stderr):
+            return name, settings
+    return "unknown", None
@@ -0,0 +1,174 @@
+""" Runs randomizer attempts as subprocesses on an asyncio event loop, with a wall-clock timeout
+and memory limit per attempt and a limit on how many attempts run at once. Timed out attempts
+are killed along with any processes they started and reported as failed attempts. """
+import os
+import sys
+import signal
+import asyncio
+import threading
+import subprocess
+import time
+import timing
+import memory_plando
+from randomizer_errors import RANDOMIZER_TIMEOUT_MESSAGE
+
+RUNNER_READ_SIZE = 1 << 16
+
+
+# Caps its own address space and then runs OoTRandomizer.py as if it was started directly. Used
+# instead of a preexec_fn, which can deadlock the child when the parent has other threads running.
+_MEMORY_LIMIT_BOOTSTRAP = """
+import os, sys, runpy, resource
+limit = int(sys.argv[1])
+resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+sys.argv = sys.argv[2:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+class RandomizerRunner:
+    """ Runs attempts with the same result contract as RandomizerPool: a CompletedProcess with a
+    returncode and stderr. Attempts can be run from several threads and share one event loop,
+    so at most concurrency of them run at once across all of them. """
+
+    def __init__(self, timeout=None, memory_limit=None, concurrency=1, randomizer_dir="randomizer"):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.concurrency = concurrency
+        self.randomizer_dir = os.path.abspath(randomizer_dir)
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        if memory_limit is not None and os.name != "posix":
+            print("RSL GENERATOR: RANDOMIZER MEMORY LIMITS ARE ONLY SUPPORTED ON LINUX AND MACOS, IGNORING IT.")
+            self.memory_limit = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, settings_json, plando_json=None):
+        """ Start an attempt and return a concurrent.futures.Future for its CompletedProcess.
+        Cancelling the future kills the attempt. """
+        # The loop thread has its own context, so hand it the caller's phase timers
+        return asyncio.run_coroutine_threadsafe(self.run_async(settings_json, timing.current(), plando_json), self._get_loop())
+
+    def run(self, settings_json, plando_json=None):
+        """ Run one randomizer attempt and wait for the result. """
+        future = self.submit(settings_json, plando_json)
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. Ctrl+C while waiting, don't leave the randomizer running
+            future.cancel()
+            raise
+
+    async def run_async(self, settings_json, times=None, plando_json=None):
+        """ Run one randomizer attempt on the event loop. The time until the randomizer first
+        logs anything is added to times as its startup. A plando_json is handed to the
+        randomizer in memory instead of its distribution_file. """
+        if self._semaphore is None:
+            # Created on the loop, since older Pythons bind it to the loop that creates it
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            with memory_plando.handoff(settings_json, plando_json) as (settings_json, pass_fds):
+                return await self._run_attempt(settings_json, times, pass_fds)
+
+    async def _run_attempt(self, settings_json, times, pass_fds=()):
+        args = [sys.executable, os.path.join(self.randomizer_dir, "OoTRandomizer.py"), "--settings=-"]
+        command = args
+        extra = {}
+        if os.name == "posix":
+            # A session of its own, so the whole process group can be killed on a timeout
+            extra["start_new_session"] = True
+            if self.memory_limit is not None:
+                command = [sys.executable, "-c", _MEMORY_LIMIT_BOOTSTRAP, str(self.memory_limit)] + args[1:]
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE, pass_fds=pass_fds, **extra)
+        stdout, stderr = [], []
+        first_output = []
+        readers = asyncio.gather(_read_stream(process.stdout, stdout), _read_stream(process.stderr, stderr, first_output))
+        timed_out = False
+        try:
+            process.stdin.write(settings_json.encode('utf-8'))
+            try:
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(process.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                _kill(process)
+                await process.wait()
+            await readers
+        except BaseException:
+            # Cancelled, e.g. by close() or Ctrl+C
+            _kill(process)
+            readers.cancel()
+            raise
+
+        if times is not None and first_output:
+            times.add("randomizer_startup", first_output[0] - start)
+        returncode = process.returncode
+        stderr = b"".join(stderr).decode('utf-8', errors='replace')
+        if timed_out:
+            returncode = returncode or 1
+            stderr += f"\n{RANDOMIZER_TIMEOUT_MESSAGE} AFTER {self.timeout} SECONDS.\n"
+        return subprocess.CompletedProcess(args, returncode, stdout=b"".join(stdout).decode('utf-8', errors='replace'), stderr=stderr)
+
+    def close(self):
+        """ Kill any running attempts and stop the event loop. """
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+            self._semaphore = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def _read_stream(stream, chunks, first_output=None):
+    while True:
+        chunk = await stream.read(RUNNER_READ_SIZE)
+        if not chunk:
+            return
+        if first_output is not None and not first_output:
+            first_output.append(time.perf_counter())
+        chunks.append(chunk)
+
+
+def _kill(process):
+    """ Kill a randomizer process and, where possible, everything it started. """
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def _cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,119 @@
+""" Long-lived randomizer worker processes. Each worker imports the randomizer once
+and then runs attempts in-process, saving the interpreter start and randomizer import
+that a fresh `OoTRandomizer.py` subprocess pays on every attempt. """
+import os
+import sys
+import io
+import json
+import logging
+import traceback
+import subprocess
+import threading
+import memory_plando
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Set in each worker process by _init_worker
+_rando_main = None
+_rando_settings = None
+
+
+def _init_worker(randomizer_dir):
+    """ Import the randomizer once when a worker process starts. """
+    global _rando_main, _rando_settings
+    # The randomizer imports its own modules by top level name
+    sys.path.insert(0, randomizer_dir)
+    from Main import main
+    from Settings import Settings
+    _rando_main = main
+    _rando_settings = Settings
+
+
+def _run_job(settings_json, plando_json=None):
+    """ Run a single randomizer attempt in a warm worker, capturing the log like stderr.
+    A plando_json is handed to the randomizer in memory instead of its distribution_file. """
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    returncode = 0
+    try:
+        with memory_plando.handoff(settings_json, plando_json) as (settings_json, _):
+            settings = _rando_settings(json.loads(settings_json))
+            _rando_main(settings)
+    except Exception:
+        # Match OoTRandomizer.py, which logs the exception and exits with 1
+        stream.write(traceback.format_exc())
+        returncode = 1
+    finally:
+        logger.removeHandler(handler)
+    return returncode, stream.getvalue()
+
+
+class RandomizerPool:
+    """ A pool of warm randomizer workers with the same result contract as running
+    `OoTRandomizer.py --settings=-`: a CompletedProcess with a returncode and stderr. """
+
+    def __init__(self, workers=1, randomizer_dir="randomizer"):
+        self.workers = workers
+        self.randomizer_dir = os.path.abspath(randomizer_dir)
+        self._executor = None
+        # Attempts can be run from several threads, e.g. by the --serve service
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                     initargs=(self.randomizer_dir,))
+            return self._executor
+
+    def submit(self, settings_json, plando_json=None):
+        """ Queue an attempt and return a future for its (returncode, stderr) result. """
+        return self._get_executor().submit(_run_job, settings_json, plando_json)
+
+    def run(self, settings_json, plando_json=None):
+        """ Run one randomizer attempt on a warm worker and wait for the result. """
+        args = [sys.executable, os.path.join(self.randomizer_dir, "OoTRandomizer.py"), "--settings=-"]
+        try:
+            returncode, stderr = self.submit(settings_json, plando_json).result()
+        except BrokenProcessPool:
+            # A worker died mid-attempt (e.g. killed or crashed in native code). Report it
+            # as a failed attempt and start fresh workers for the next one.
+            self.close()
+            return subprocess.CompletedProcess(args, 1, stdout='', stderr="RSL GENERATOR: RANDOMIZER WORKER DIED DURING THE ATTEMPT.\n")
+        return subprocess.CompletedProcess(args, returncode, stdout='', stderr=stderr)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InProcessRandomizer:
+    """ Runs attempts in the current process with the same contract as RandomizerPool.
+    Used by processes that are already pool workers themselves, e.g. the --jobs processes. """
+
+    def __init__(self, randomizer_dir="randomizer"):
+        self.randomizer_dir = os.path.abspath(randomizer_dir)
+
+    def run(self, settings_json, plando_json=None):
+        """ Run one randomizer attempt, importing the randomizer on first use. """
+        if _rando_main is None:
+            _init_worker(self.randomizer_dir)
+        returncode, stderr = _run_job(settings_json, plando_json)
+        args = [sys.executable, os.path.join(self.randomizer_dir, "OoTRandomizer.py"), "--settings=-"]
+        return subprocess.CompletedProcess(args, returncode, stdout='', stderr=stderr)
+
+    def close(self):
+        pass
@@ -3,18 +3,18 @@ import sys
 import datetime
 import json
 import random
+from types import MappingProxyType
 import conditionals as conds
 from multiselects import resolve_multiselects, ms_option_lookup
-from rslversion import __version__
-sys.path.append("randomizer")
-from randomizer.ItemPool import trade_items, child_trade_items
-from randomizer.SettingsList import get_settings_from_tab, get_settings_from_section, SettingInfos
-from randomizer.StartingItems import inventory, songs, equipment
+from rslversion import __version__, randomizer_commit
+from settings_schema import get_schema
+from samplers import CategoricalSampler, UniformIntSampler
 from utils import geometric_weights
+import timing
 
 def get_setting_info(setting_name):
     """ Quick replacement for removed function in the randomizer. """
-    return SettingInfos.setting_infos[setting_name]
+    return get_schema().setting_infos[setting_name]
 
 
 def load_weights_file(weights_fname):
@@ -37,10 +37,11 @@ def parse_weights(datain):
 
 def generate_balanced_weights(fname="default_weights.json"):
     """ Generate a file with even weights for each setting. """
-    settings_to_randomize = list(get_settings_from_tab("main_tab"))[1:] + \
-                list(get_settings_from_tab("detailed_tab")) + \
-                list(get_settings_from_tab("other_tab")) + \
-                list(get_settings_from_tab("starting_tab"))
+    schema = get_schema()
+    settings_to_randomize = list(schema.settings_from_tab("main_tab"))[1:] + \
+                list(schema.settings_from_tab("detailed_tab")) + \
+                list(schema.settings_from_tab("other_tab")) + \
+                list(schema.settings_from_tab("starting_tab"))
 
     exclude_from_weights = ["bridge_tokens", "ganon_bosskey_tokens", "bridge_hearts", "ganon_bosskey_hearts",
                             "triforce_goal_per_world", "triforce_count_per_world", "disabled_locations",
@@ -59,16 +60,17 @@ def generate_balanced_weights(fname="default_weights.json"):
     return weight_dict
 
 
-def draw_starting_item_pool(random_settings, start_with):
+def draw_starting_item_pool(random_settings, start_with, rng=random):
     """ Select starting items, songs, and equipment. """
+    schema = get_schema()
     random_settings["starting_inventory"] = draw_choices_from_pool({
-        name: info
-        for name, info in inventory.items()
-        if (info.item_name not in trade_items or info.item_name in random_settings["adult_trade_start"])
-        and (info.item_name not in child_trade_items or info.item_name in random_settings["shuffle_child_trade"] or info.item_name == 'Zeldas Letter')
-    })
-    random_settings["starting_songs"] = draw_choices_from_pool(songs)
-    random_settings["starting_equipment"] = draw_choices_from_pool(equipment)
+        name: item_name
+        for name, item_name in schema.inventory.items()
+        if (item_name not in schema.trade_items or item_name in random_settings["adult_trade_start"])
+        and (item_name not in schema.child_trade_items or item_name in random_settings["shuffle_child_trade"] or item_name == 'Zeldas Letter')
+    }, rng)
+    random_settings["starting_songs"] = draw_choices_from_pool(schema.songs, rng)
+    random_settings["starting_equipment"] = draw_choices_from_pool(schema.equipment, rng)
 
     for key, val in start_with.items():
         for thing in val:
@@ -76,50 +78,93 @@ def draw_starting_item_pool(random_settings, start_with):
                 random_settings[key] += [thing]
 
 
-def draw_choices_from_pool(itempool):
-    N = random.choices(range(len(itempool)), weights=geometric_weights(len(itempool)))[0]
-    return random.sample(list(itempool.keys()), N)
+def draw_choices_from_pool(itempool, rng=random):
+    N = rng.choices(range(len(itempool)), weights=geometric_weights(len(itempool)))[0]
+    return rng.sample(list(itempool.keys()), N)
+
+
+# Settings with a matching _random setting that picks the value in the randomizer instead
+RANDOM_PLANDO_SETTINGS = ["trials", "chicken_count", "big_poe_count"]
 
 
 def remove_plando_if_random(random_settings):
     """ For settings that have a _random option, remove the specific plando if _random is true """
-    settings_to_check = ["trials", "chicken_count", "big_poe_count"]
-    for setting in settings_to_check:
+    for setting in RANDOM_PLANDO_SETTINGS:
         if random_settings[setting+'_random'] == "true":
             random_settings.pop(setting)
 
 
+class DisableIndex:
+    """ Which settings each value of a setting disables in the randomizer GUI. The schema
+    snapshot has already expanded the sections and tabs of the randomizer's disable rules. """
+
+    def __init__(self):
+        self._matching = {}  # setting -> {option: settings disabled when the setting is that option}
+        self._not_matching = {}  # setting -> [(option, settings disabled when the setting is not that option)]
+        self._cache = {}
+        self._rules = set()
+        for setting, info in get_schema().setting_infos.items():
+            if info.disable is None:
+                continue
+            self._rules.add(setting)
+            for option, disabling in info.disable.items():
+                disabled = set(disabling.get('settings', []))
+                if isinstance(option, str) and option.startswith('!'):
+                    self._not_matching.setdefault(setting, []).append((option[1:], frozenset(disabled)))
+                else:
+                    self._matching.setdefault(setting, {})[option] = frozenset(disabled)
+
+    def has_rules(self, setting):
+        """ Whether any value of the setting disables other settings. """
+        return setting in self._rules
+
+    def disabled_by(self, setting, choice):
+        """ The frozenset of settings disabled when setting is set to choice. """
+        if setting not in self._rules:
+            return frozenset()
+        try:
+            return self._cache[(setting, choice)]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable choices (multiselect lists) can only match the negated rules
+            return self._lookup(setting, choice)
+        disabled = self._cache[(setting, choice)] = self._lookup(setting, choice)
+        return disabled
+
+    def _lookup(self, setting, choice):
+        disabled = set()
+        for option, settings in self._matching.get(setting, {}).items():
+            if choice == option:
+                disabled |= settings
+        for option, settings in self._not_matching.get(setting, []):
+            if choice != option:
+                disabled |= settings
+        return frozenset(disabled)
+
+
+# Disable indexes by randomizer commit, since they only change when the randomizer does
+_disable_indexes = {}
+
+
+def get_disable_index():
+    """ The DisableIndex for the current randomizer, built on first use. """
+    if randomizer_commit not in _disable_indexes:
+        _disable_indexes[randomizer_commit] = DisableIndex()
+    return _disable_indexes[randomizer_commit]
+
+
 def remove_redundant_settings(random_settings):
     """ Disable settings that the randomizer expects to be disabled.
     The randomizer will reject plandos with disabled settings set to non-default values.
     Settings are considered disabled if they are disabled in the randomizer GUI by another setting.
     """
-    settings_list = list(random_settings.keys())
-    for setting in settings_list:
+    index = get_disable_index()
+    for setting in list(random_settings.keys()):
         # As we're iterating, the setting may already have been deleted/disabled by a previous setting
-        if setting in random_settings.keys():
-            info = get_setting_info(setting)
-            choice = random_settings[setting]
-            if info.disable is not None:
-                for option, disabling in info.disable.items():
-                    negative = False
-                    if isinstance(option, str) and option[0] == '!':
-                        negative = True
-                        option = option[1:]
-                    if (choice == option) != negative:
-                        for other_setting in disabling.get('settings', []):
-                            remove_disabled_setting(random_settings, other_setting)
-                        for section in disabling.get('sections', []):
-                            for other_setting in get_settings_from_section(section):
-                                remove_disabled_setting(random_settings, other_setting)
-                        for tab in disabling.get('tabs', []):
-                            for other_setting in get_settings_from_tab(tab):
-                                remove_disabled_setting(random_settings, other_setting)
-
-
-def remove_disabled_setting(random_settings, other_setting):
-    if other_setting in random_settings.keys():
-        random_settings.pop(other_setting)
+        if setting in random_settings:
+            for other_setting in index.disabled_by(setting, random_settings[setting]):
+                random_settings.pop(other_setting, None)
 
 
 def draw_dungeon_shortcuts(random_settings):
@@ -129,12 +174,12 @@ def draw_dungeon_shortcuts(random_settings):
     random_settings["dungeon_shortcuts"] = random.sample(dungeon_shortcuts_opts, N)
 
 
-def generate_weights_override(weights, override_weights_fname):
+def generate_weights_override(weights, override_weights_fname, override_data=None):
     # Load the weight dictionary
     if weights == "RSL":
         weight_options, conditionals, weight_multiselect, weight_dict = load_weights_file("weights/rsl_season7.json")
     elif weights == "full-random":
-        weight_options = None
+        weight_options, conditionals, weight_multiselect = None, None, None
         weight_dict = generate_balanced_weights(None)
     else:
         weight_options, conditionals, weight_multiselect, weight_dict = load_weights_file(weights)
@@ -142,8 +187,10 @@ def generate_weights_override(weights, override_weights_fname):
 
     # If an override_weights file name is provided, load it
     start_with = {"starting_inventory":[], "starting_songs":[], "starting_equipment":[]}
-    if override_weights_fname is not None:
-        if override_weights_fname == '-':
+    if override_weights_fname is not None or override_data is not None:
+        if override_data is not None:
+            override_options, override_conditionals, override_multiselect, override_weights = parse_weights(override_data)
+        elif override_weights_fname == '-':
             print("RSL GENERATOR: LOADING OVERRIDE WEIGHTS from standard input")
             override_options, override_conditionals, override_multiselect, override_weights = parse_weights(json.load(sys.stdin))
         else:
@@ -200,82 +247,290 @@ def generate_weights_override(weights, override_weights_fname):
     return weight_options, conditionals, weight_multiselect, weight_dict, start_with
 
 
-def generate_plando(weights, override_weights_fname, no_seed, plando_filename_base='random_settings'):
-    weight_options, conditionals, weight_multiselects, weight_dict, start_with = generate_weights_override(weights, override_weights_fname)
-
-    ####################################################################################
-    # Make a new function that parses the weights file that does this stuff
-    ####################################################################################
-    # Generate even weights for tokens, hearts, and triforce pieces given the max value (Maybe put this into the step that loads the weights)
-    for nset in ["bridge_tokens", "ganon_bosskey_tokens", "bridge_hearts", "ganon_bosskey_hearts", "triforce_goal_per_world", "triforce_count_per_world"]:
-        kwx = nset + "_max"
-        kwn = nset + "_min"
-        nmax = weight_options[kwx] if kwx in weight_options else 100
-        nmin = weight_options[kwn] if kwn in weight_options else 1
-        weight_dict[nset] = {i: 100./(nmax - nmin + 1) for i in range(nmin, nmax + 1)}
-        if kwx in weight_dict:
-            weight_dict.pop(kwx)
-        if kwn in weight_dict:
-            weight_dict.pop(kwn)
-    ####################################################################################
-
-    # Draw the random settings
-    random_settings = {}
-    for setting, options in weight_dict.items():
-        random_settings[setting] = random.choices(list(options.keys()), weights=list(options.values()))[0]
-
-    # Draw the multiselects
-    if weight_multiselects is not None:
-        random_settings.update(resolve_multiselects(weight_multiselects))
+# Settings whose options are every integer between a min and max given in the weights options
+RANGE_SETTINGS = ["bridge_tokens", "ganon_bosskey_tokens", "bridge_hearts", "ganon_bosskey_hearts", "triforce_goal_per_world", "triforce_count_per_world"]
+
+
+def _freeze(value):
+    """ Recursively make loaded weights data read-only. """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(val) for val in value)
+    return value
+
+
+def _thaw(value):
+    """ Undo _freeze, giving plain dicts and lists. """
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(val) for key, val in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(val) for val in value]
+    return value
+
+
+class WeightsProfile:
+    """ Weights, options, conditionals and multiselects merged from a weights file and an optional
+    override, loaded once and shared read-only by every plando rolled from them.
+    Each setting gets a precomputed sampler so that rolling a seed only samples.
+    """
+
+    def __init__(self, weight_options, conditionals, weight_multiselect, weight_dict, start_with):
+        # An options section, even an empty one, turns off the randomizer's default misc hints
+        self.has_options = weight_options is not None
+        weight_options = weight_options if weight_options is not None else {}
+
+        # The min and max of ranges only belong in the options, drop any given as weights
+        for nset in RANGE_SETTINGS:
+            weight_dict.pop(nset + "_max", None)
+            weight_dict.pop(nset + "_min", None)
+        samplers = {setting: CategoricalSampler(options.keys(), options.values()) for setting, options in weight_dict.items()}
+
+        # Draw tokens, hearts, and triforce pieces evenly between the min and max values
+        for nset in RANGE_SETTINGS:
+            kwx = nset + "_max"
+            kwn = nset + "_min"
+            nmax = weight_options[kwx] if kwx in weight_options else 100
+            nmin = weight_options[kwn] if kwn in weight_options else 1
+            samplers[nset] = UniformIntSampler(nmin, nmax)
+
+        self.weight_options = _freeze(weight_options)
+        self.conditionals = _freeze(conditionals) if conditionals is not None else None
+        self.weight_multiselect = _freeze(weight_multiselect) if weight_multiselect is not None else None
+        self.weight_dict = _freeze(weight_dict)
+        self.start_with = _freeze(start_with)
+        self._samplers = samplers
+
+    @classmethod
+    def load(cls, weights, override_weights_fname=None, override_data=None):
+        """ Load and merge a weights file ("RSL", "full-random" or a path) and an optional override,
+        either a file or already loaded override weights data. """
+        with timing.phase("weights_load"):
+            return cls(*generate_weights_override(weights, override_weights_fname, override_data))
+
+    def __reduce__(self):
+        # Read-only mappings can't be pickled, so rebuild from plain copies (e.g. for --jobs processes)
+        return (self.__class__, (_thaw(self.weight_options) if self.has_options else None, _thaw(self.conditionals), _thaw(self.weight_multiselect),
+                                 _thaw(self.weight_dict), _thaw(self.start_with)))
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_samplers"):
+            raise AttributeError("WeightsProfile is read-only")
+        super().__setattr__(name, value)
+
+    def settings(self):
+        """ The names of every setting drawn from the weights, in weights file order. """
+        return self._samplers.keys()
+
+    def sampler(self, setting):
+        """ The precomputed sampler for a setting. """
+        return self._samplers[setting]
+
+    def options(self, setting):
+        """ The options a setting can be drawn with. """
+        return self._samplers[setting].options
+
+    def draw(self, setting, excluded=(), rng=random):
+        """ Draw an option for a setting, skipping any excluded options. """
+        sampler = self._samplers[setting]
+        if excluded:
+            sampler = sampler.without(excluded)
+        return sampler.draw(rng)
+
+    def draw_all(self, rng=random):
+        """ Draw an option for every setting. """
+        return {setting: sampler.draw(rng) for setting, sampler in self._samplers.items()}
+
+    def new_start_with(self):
+        """ A fresh copy of the forced starting items that conditionals can add to for one seed. """
+        return {key: list(value) for key, value in self.start_with.items()}
+
+
+class SeedWeights:
+    """ One seed's view of a WeightsProfile. Conditionals exclude options here rather than
+    editing the shared profile, so nothing has to be copied or reloaded per seed. """
+
+    def __init__(self, profile, rng=random):
+        self.profile = profile
+        self.rng = rng
+        self._excluded = {}
+
+    def exclude(self, setting, *options):
+        """ Stop the given options from being drawn for a setting for the rest of this seed. """
+        self._excluded.setdefault(setting, set()).update(options)
+
+    def draw(self, setting):
+        """ Draw an option for a setting from the remaining options. """
+        return self.profile.draw(setting, self._excluded.get(setting, ()), self.rng)
+
+
+def draw_base_settings(profile, previous=None, reroll=(), rng=random):
+    """ Draw every weighted setting and multiselect, before any conditionals are applied.
+    Given the draws of an earlier roll, only the settings in reroll are drawn again. """
+    with timing.phase("sampling"):
+        draws = profile.draw_all(rng)
+        if profile.weight_multiselect is not None:
+            draws.update(resolve_multiselects(profile.weight_multiselect, rng))
+        if previous is not None:
+            draws = {setting: draws[setting] if setting in reroll else value for setting, value in previous.items()}
+    return draws
+
+
+def roll_random_settings(profile, draws=None, rng=random):
+    """ Roll a set of random settings from a WeightsProfile, ready to be saved as a plando.
+    Conditionals and the remaining steps are applied on top of draws, which are drawn fresh if not given. """
+    weight_options = profile.weight_options
+    seed_weights = SeedWeights(profile, rng)
+    start_with = profile.new_start_with()
+
+    if draws is None:
+        draws = draw_base_settings(profile, rng=rng)
+    # Conditionals edit the settings and multiselect lists in place, so keep the draws untouched
+    random_settings = {setting: list(value) if isinstance(value, list) else value for setting, value in draws.items()}
 
     # Set the conditionals
-    if conditionals is not None:
-        conds.parse_conditionals(conditionals, weight_dict, random_settings, start_with)
+    if profile.conditionals is not None:
+        with timing.phase("conditionals"):
+            conds.parse_conditionals(profile.conditionals, seed_weights, random_settings, start_with, rng)
 
     # Add starting items, tricks, and excluded locations
-    if weight_options is not None:
+    if profile.has_options:
         if "tricks" in weight_options:
-            random_settings["allowed_tricks"] = weight_options["tricks"]
+            random_settings["allowed_tricks"] = list(weight_options["tricks"])
         if "disabled_locations" in weight_options:
-            random_settings["disabled_locations"] = weight_options["disabled_locations"]
-        random_settings["misc_hints"] = weight_options["misc_hints"] if "misc_hints" in weight_options else []
+            random_settings["disabled_locations"] = list(weight_options["disabled_locations"])
+        random_settings["misc_hints"] = list(weight_options["misc_hints"]) if "misc_hints" in weight_options else []
         if "starting_items" in weight_options and weight_options["starting_items"] == True:
-            draw_starting_item_pool(random_settings, start_with)
+            draw_starting_item_pool(random_settings, start_with, rng)
 
     # Remove plando setting if a _random setting is true
     remove_plando_if_random(random_settings)
 
     # Format numbers and bools to not be strings
     for setting, value in random_settings.items():
-        setting_type = get_setting_info(setting).type
-        if setting_type is bool:
-            if value == "true":
-                value = True
-            elif value == "false":
-                value = False
-            else:
-                raise TypeError(f'Value for setting {setting!r} must be "true" or "false"')
-        elif setting_type is int:
-            value = int(value)
-        elif setting_type is not str and setting not in ["allowed_tricks", "disabled_locations", "starting_inventory", "misc_hints", "starting_songs", "starting_equipment", "hint_dist_user", "dungeon_shortcuts"] + list(ms_option_lookup.keys()):
-            raise NotImplementedError(f'{setting} has an unsupported setting type: {setting_type!r}')
-        random_settings[setting] = value
+        random_settings[setting] = format_setting_value(setting, value)
 
     # Remove conflicting "dead" settings since rando won't ignore them anymore
-    remove_redundant_settings(random_settings)
+    with timing.phase("remove_redundant"):
+        remove_redundant_settings(random_settings)
+    return random_settings
+
 
+# Settings whose values are passed to the randomizer as rolled
+LIST_SETTINGS = frozenset(["allowed_tricks", "disabled_locations", "starting_inventory", "misc_hints", "starting_songs", "starting_equipment", "hint_dist_user", "dungeon_shortcuts"] + list(ms_option_lookup.keys()))
+
+
+def format_setting_value(setting, value):
+    """ Convert a rolled option to the type the randomizer uses for the setting. """
+    setting_type = get_setting_info(setting).type
+    if setting_type is bool:
+        if value == "true":
+            return True
+        elif value == "false":
+            return False
+        raise TypeError(f'Value for setting {setting!r} must be "true" or "false"')
+    elif setting_type is int:
+        return int(value)
+    elif setting_type is not str and setting not in LIST_SETTINGS:
+        raise NotImplementedError(f'{setting} has an unsupported setting type: {setting_type!r}')
+    return value
+
+
+class InvalidPlandoError(Exception):
+    """ Settings were rolled that the randomizer would reject. """
+
+
+SETTING_TYPE_CHECKS = {
+    bool: lambda value: isinstance(value, bool),
+    int: lambda value: isinstance(value, int) and not isinstance(value, bool),
+    str: lambda value: isinstance(value, str),
+    list: lambda value: isinstance(value, list),
+    dict: lambda value: isinstance(value, dict),
+}
+
+
+def validate_plando(random_settings):
+    """ Check rolled settings against the randomizer's settings schema before running the randomizer.
+    Returns a list of problems, which is empty if the settings are valid.
+    """
+    problems = []
+    schema = get_schema()
+    index = get_disable_index()
+    for setting, value in random_settings.items():
+        info = schema.setting_infos.get(setting)
+        if info is None:
+            problems.append(f"{setting} is not a randomizer setting")
+            continue
+        type_check = SETTING_TYPE_CHECKS.get(info.type)
+        if type_check is not None and not type_check(value):
+            problems.append(f"{setting} must be a {info.type.__name__}, not {value!r}")
+            continue
+
+        # Check options against the multiselect lookup or the randomizer's choices
+        allowed = ms_option_lookup.get(setting, info.choices)
+        if isinstance(value, list):
+            if allowed:
+                unknown = [option for option in value if option not in allowed]
+                if unknown:
+                    problems.append(f"{setting} has unknown options {unknown}")
+        elif info.choices and not isinstance(value, dict) and value not in info.choices:
+            problems.append(f"{setting} has unknown option {value!r}")
+
+    # Settings disabled by another setting must be left out or at their default. A setting that
+    # was left out disables settings at its default, which remove_redundant_settings doesn't check
+    for setting, info in schema.setting_infos.items():
+        if not index.has_rules(setting):
+            continue
+        value = random_settings[setting] if setting in random_settings else info.default
+        for other_setting in index.disabled_by(setting, value):
+            if other_setting in random_settings and random_settings[other_setting] != schema.setting_infos[other_setting].default:
+                problems.append(f"{other_setting} is disabled by {setting}={value!r} but set to {random_settings[other_setting]!r}")
+    return problems
+
+
+def roll_valid_settings(profile, draws=None, max_rolls=100, rng=random):
+    """ Roll settings that pass validate_plando, rerolling invalid ones in-process instead of
+    sending them to the randomizer. Returns the draws used along with the settings. """
+    for _ in range(max_rolls):
+        if draws is None:
+            draws = draw_base_settings(profile, rng=rng)
+        random_settings = roll_random_settings(profile, draws, rng)
+        problems = validate_plando(random_settings)
+        if not problems:
+            return draws, random_settings
+        print(f"RSL GENERATOR: REROLLING INVALID SETTINGS: {'; '.join(problems)}")
+        draws = None
+    raise InvalidPlandoError(f"Could not roll valid settings in {max_rolls} attempts: {'; '.join(problems)}")
+
+
+def generate_plando(profile, no_seed, plando_filename_base='random_settings', max_rolls=100, rng=random):
+    """ Roll a set of valid random settings from a WeightsProfile and save them as a plando file.
+    Pass a seeded random.Random as rng to make the roll reproducible. """
+    _, random_settings = roll_valid_settings(profile, max_rolls=max_rolls, rng=rng)
+    return write_plando(random_settings, no_seed, plando_filename_base)
+
+
+def plando_output(random_settings):
+    """ The plando file contents for rolled settings. """
     # Add the RSL Script version to the plando
     random_settings['user_message'] = f'RSL Script v{__version__}'
+    return {"settings": random_settings}
+
+
+def new_plando_filename(plando_filename_base='random_settings'):
+    return f'{plando_filename_base}_{datetime.datetime.now(datetime.timezone.utc):%Y-%m-%d_%H-%M-%S_%f}.json'
+
 
-    # Save the output plando
-    output = {"settings": random_settings}
+def write_plando(random_settings, no_seed, plando_filename_base='random_settings'):
+    """ Save rolled settings as a plando file in the data directory. """
+    output = plando_output(random_settings)
 
-    plando_filename = f'{plando_filename_base}_{datetime.datetime.now(datetime.timezone.utc):%Y-%m-%d_%H-%M-%S_%f}.json'
+    plando_filename = new_plando_filename(plando_filename_base)
 
-    if not os.path.isdir("data"):
-        os.mkdir("data")
-    with open(os.path.join("data", plando_filename), 'w') as fp:
-        json.dump(output, fp, indent=4)
+    with timing.phase("plando_write"):
+        os.makedirs("data", exist_ok=True)
+        with open(os.path.join("data", plando_filename), 'w') as fp:
+            json.dump(output, fp, indent=4)
     if no_seed:
         print(f"Plando File: {plando_filename}")
 
@@ -0,0 +1,220 @@
+""" A long-running local generation service for `--serve`. Weights profiles, the settings schema,
+the prepared rom and the randomizer workers are loaded once and reused by every request, so a
+request only pays for rolling settings and running the randomizer.
+
+POST /generate with a JSON body, all fields optional:
+    {"preset": "beginner", "no_seed": false, "worldcount": 1, "rng_seed": "abc"}
+A request can give override weights data as "override" instead of a preset.
+GET /status reports the queue and cache sizes. """
+import os
+import json
+import queue
+import base64
+import random
+import re
+import tempfile
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import roll_settings as rs
+import rsl_tools as tools
+from utils import seeded_rng
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PROFILE_CACHE_SIZE = 32
+SERVICE_MAX_REQUEST_SIZE = 1 << 20
+_patch_file_line = re.compile(r"Created patch ?file at: (.+)")
+
+
+class ServiceRequestError(Exception):
+    """ A request the service can't run, with the HTTP status to answer it with. """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class GenerationService:
+    """ Runs generation requests on args["jobs"] threads, with at most queue_size requests waiting. """
+
+    def __init__(self, args, weights, roll_seed, queue_size=16, pool=None):
+        self.args = args
+        self.weights = weights
+        self.roll_seed = roll_seed
+        self.pool = pool
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Loaded once and kept out of the cache, an --override - can't be read from stdin again
+        self.default_profile = rs.WeightsProfile.load(weights, args["override_fname"])
+        self._profiles = OrderedDict()
+        self._profiles_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run_jobs, daemon=True) for _ in range(args["jobs"])]
+        for thread in self._threads:
+            thread.start()
+
+    def profile(self, preset=None, override=None):
+        """ The WeightsProfile for a preset override file or override weights data, loaded once.
+        With neither, the --override given to the service is used. """
+        if preset is None and override is None:
+            return self.default_profile
+        key = (preset, json.dumps(override, sort_keys=True) if override is not None else None)
+        with self._profiles_lock:
+            if key in self._profiles:
+                self._profiles.move_to_end(key)
+                return self._profiles[key]
+
+        override_fname = _preset_filename(preset) if preset is not None else None
+        try:
+            profile = rs.WeightsProfile.load(self.weights, override_fname, override)
+        except (KeyError, TypeError, AttributeError, ValueError) as ex:
+            raise ServiceRequestError(f"Invalid override weights: {ex!r}")
+
+        with self._profiles_lock:
+            self._profiles[key] = profile
+            while len(self._profiles) > SERVICE_PROFILE_CACHE_SIZE:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def submit(self, request):
+        """ Queue a request and return a Future for its response. """
+        if not isinstance(request, dict):
+            raise ServiceRequestError("The request body must be a JSON object")
+        unknown = set(request) - {"preset", "override", "no_seed", "worldcount", "rng_seed"}
+        if unknown:
+            raise ServiceRequestError(f"Unknown request fields: {', '.join(sorted(unknown))}")
+        worldcount = request.get("worldcount", 1)
+        if not isinstance(worldcount, int) or worldcount < 1:
+            raise ServiceRequestError("worldcount must be a positive integer")
+        override = request.get("override")
+        if override is not None and not isinstance(override, dict):
+            raise ServiceRequestError("override must be a weights JSON object")
+        if override is not None and request.get("preset") is not None:
+            raise ServiceRequestError("Give either a preset or override weights, not both")
+
+        future = Future()
+        try:
+            self._queue.put_nowait((next(self._job_ids), request, future))
+        except queue.Full:
+            raise ServiceRequestError("The job queue is full, try again later", status=503)
+        return future
+
+    def status(self):
+        with self._profiles_lock:
+            cached = len(self._profiles)
+        return {"queued": self._queue.qsize(), "queue_size": self._queue.maxsize, "running": self._active,
+                "jobs": len(self._threads), "cached_profiles": cached}
+
+    def _run_jobs(self):
+        while True:
+            job_id, request, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._active_lock:
+                self._active += 1
+            try:
+                future.set_result(self._generate(job_id, request))
+            except BaseException as ex:
+                future.set_exception(ex)
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+
+    def _generate(self, job_id, request):
+        profile = self.profile(request.get("preset"), request.get("override"))
+        rng_seed = request.get("rng_seed")
+
+        # A service started with --no_seed only rolls plandos
+        if self.args["no_seed"] or request.get("no_seed", False):
+            rng = random if rng_seed is None else seeded_rng(rng_seed, 0, 0)
+            _, random_settings = rs.roll_valid_settings(profile, rng=rng)
+            return {"plando": rs.plando_output(random_settings)}
+
+        # Each request gets its own plando names so concurrent requests can't collide
+        args = dict(self.args, no_seed=False, worldcount=request.get("worldcount", 1), rng_seed=rng_seed,
+                    seed_count=1, jobs=1, plando_filename_base=f"{self.args['plando_filename_base']}_service{job_id}")
+        # The patch and spoiler are sent back, so nothing the randomizer writes is kept
+        with tempfile.TemporaryDirectory(prefix="rsl_service_") as output_dir:
+            completed_process = self.roll_seed(args, profile, 0, self.pool, output_dir)
+            response = {}
+            patch = _patch_file_line.search(completed_process.stderr)
+            if patch is not None:
+                response["patch_filename"] = os.path.basename(patch.group(1).strip())
+                with open(patch.group(1).strip(), 'rb') as fin:
+                    response["patch"] = base64.b64encode(fin.read()).decode('ascii')
+            spoiler = tools._spoiler_log_line.search(completed_process.stderr)
+            if spoiler is not None:
+                response["spoiler_filename"] = os.path.basename(spoiler.group(1).strip())
+                with open(spoiler.group(1).strip(), encoding='utf-8') as fin:
+                    response["spoiler"] = json.load(fin)
+        return response
+
+
+def _preset_filename(preset):
+    """ The weights file for a preset name, e.g. "beginner" for weights/beginner_override.json. """
+    if not isinstance(preset, str) or os.path.basename(preset) != preset:
+        raise ServiceRequestError("preset must be the name of a file in the weights directory")
+    for fname in [f"{preset}_override.json", f"{preset}.json", preset]:
+        if os.path.isfile(os.path.join("weights", fname)):
+            return os.path.join("weights", fname)
+    raise ServiceRequestError(f"Unknown preset: {preset}", status=404)
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/status":
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_json(200, self.server.service.status())
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVICE_MAX_REQUEST_SIZE:
+            self._send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = self.server.service.submit(request).result()
+        except json.JSONDecodeError as ex:
+            self._send_json(400, {"error": f"Invalid JSON: {ex}"})
+        except ServiceRequestError as ex:
+            self._send_json(ex.status, {"error": str(ex)})
+        except rs.InvalidPlandoError as ex:
+            self._send_json(422, {"error": str(ex)})
+        except tools.RandomizerError as ex:
+            self._send_json(500, {"error": "The randomizer failed", "stderr": str(ex)})
+        except Exception as ex:
+            self._send_json(500, {"error": repr(ex)})
+        else:
+            self._send_json(200, response)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "5")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(args, weights, roll_seed, port, queue_size=16, pool=None):
+    """ Answer generation requests on localhost until interrupted. """
+    service = GenerationService(args, weights, roll_seed, queue_size, pool)
+    server = ThreadingHTTPServer((SERVICE_HOST, port), _ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"RSL GENERATOR: SERVING ON http://{SERVICE_HOST}:{port} WITH {args['jobs']} JOBS AND A QUEUE OF {queue_size}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
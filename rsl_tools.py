@@ -5,17 +5,23 @@ import subprocess
 import os
 import json
 import glob
-sys.path.append("randomizer")
-# from randomizer.SettingsList import get_setting_info
-from randomizer.SettingsList import SettingInfos
+import struct
+import hashlib
+import math
+import platform
+import re
+from settings_schema import get_schema
 from multiselects import ms_option_lookup
+from randomizer_errors import RANDOMIZER_TIMEOUT_MESSAGE
+import timing
+import memory_plando
 
 
-def randomizer_settings_func(rootdir=os.getcwd(), plando_filename='random_settings.json', worldcount=1):
+def randomizer_settings_func(rootdir=os.getcwd(), plando_filename='random_settings.json', worldcount=1, rom=None, output_dir=None):
     """ Set the base randomizer settings. This function is a placeholder for a future GUI """
     return {
-        "rom": find_rom_file(),
-        "output_dir": os.path.join(rootdir, 'patches'),
+        "rom": rom if rom is not None else prepare_rom(find_rom_file()),
+        "output_dir": os.path.abspath(output_dir) if output_dir is not None else os.path.join(rootdir, 'patches'),
         "compress_rom": "Patch",
         "enable_distribution_file": "True",
         "distribution_file": os.path.join(rootdir, "data", plando_filename),
@@ -32,43 +38,262 @@ def init_randomizer_settings(plando_filename='random_settings.json', worldcount=
         json.dump(settings, fout, indent=4)
 
 
-def generate_patch_file(plando_filename='random_settings.json', worldcount=1, max_retries=3):
-    """ Using the randomized settings, roll a seed using the randomizer CLI. """
-    settings = json.dumps(randomizer_settings_func(plando_filename=plando_filename, worldcount=worldcount))
+def generate_patch_file(plando_filename='random_settings.json', worldcount=1, max_retries=3, pool=None, rom=None, rng=None, settings_sidecar=False, plando_json=None, output_dir=None):
+    """ Using the randomized settings, roll a seed using the randomizer CLI.
+    If a RandomizerPool or RandomizerRunner is given, the attempts run on it instead.
+    If plando_json is given, it is handed to the randomizer in memory and plando_filename is never read.
+    The patch and spoiler are saved to output_dir, or to the patches directory by default.
+    If a seeded rng is given, each attempt's randomizer seed is drawn from it.
+    With settings_sidecar, a small *_Settings.json is saved next to each spoiler log for --benchmark. """
+    base_settings = randomizer_settings_func(plando_filename=plando_filename, worldcount=worldcount, rom=rom, output_dir=output_dir)
+    settings = json.dumps(base_settings)
 
     retries = 0
     while True:
         print(f"RSL GENERATOR: RUNNING THE RANDOMIZER - ATTEMPT {retries+1} OF {max_retries}")
-        completed_process = subprocess.run(
-            [sys.executable, os.path.join("randomizer", "OoTRandomizer.py"), "--settings=-"],
-            capture_output=True,
-            input=settings,
-            encoding='utf-8',
-        )
+        if rng is not None:
+            base_settings["seed"] = f"{rng.getrandbits(64):016X}"
+            settings = json.dumps(base_settings)
+        with timing.phase("randomizer"):
+            if pool is not None:
+                completed_process = pool.run(settings, plando_json)
+            else:
+                with memory_plando.handoff(settings, plando_json) as (attempt_settings, pass_fds):
+                    completed_process = subprocess.run(
+                        [sys.executable, os.path.join("randomizer", "OoTRandomizer.py"), "--settings=-"],
+                        capture_output=True,
+                        input=attempt_settings,
+                        encoding='utf-8',
+                        pass_fds=pass_fds,
+                    )
 
         if completed_process.returncode != 0:
             retries += 1
+            if RANDOMIZER_TIMEOUT_MESSAGE in completed_process.stderr:
+                # Another attempt with the same settings would most likely hang again
+                print("RSL GENERATOR: RANDOMIZER TIMED OUT. RESELECTING SETTINGS.")
+                break
             if retries < max_retries:
                 continue
             print(f"RSL GENERATOR: MAX RETRIES ({max_retries}) REACHED. RESELECTING SETTINGS.")
             break
+        if settings_sidecar:
+            write_settings_sidecars(completed_process.stderr)
         break
     return completed_process
 
 
-# This function will probably need some more meat to it. If the user is patching the z64 file in the same directory it will find that
-def find_rom_file():
-    """ Find the Ocarina of Time rom file stored by the user in this directory. """
-    rom_extensions = ["*.n64", "*.N64", "*.z64", "*.Z64"]
-    for ext in rom_extensions:
-        rom_filename = glob.glob(os.path.join(os.getcwd(), "**", ext), recursive=True)
-        if len(rom_filename) > 0:
-            break
+SPOILER_SUFFIX = "_Spoiler.json"
+SETTINGS_SIDECAR_SUFFIX = "_Settings.json"
+SPOILER_READ_SIZE = 1 << 16
+_spoiler_log_line = re.compile(r"Created spoiler log at: (.+)")
+# The next string or bracket, so the scanner can jump over everything in between
+_spoiler_token = re.compile(r'["{}\[\]]')
+_spoiler_string = re.compile(r'"(?:[^"\\]|\\.)*"')
+_json_whitespace = re.compile(r'\s*')
+
+
+def read_spoiler_settings(spoiler_filename):
+    """ Read only the top level "settings" object of a spoiler log. The file is read in blocks and
+    the rest of the log (locations, playthrough, entrances) is skipped without being decoded, so
+    memory use stays small no matter how large the spoiler is. """
+    decoder = json.JSONDecoder()
+    with open(spoiler_filename, encoding='utf-8') as fin:
+        buffer = ''
+        pos = 0
+        depth = 0
+        eof = False
+
+        def fill():
+            # Drop what has been scanned and read the next block
+            nonlocal buffer, pos, eof
+            block = fin.read(SPOILER_READ_SIZE)
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+            return not eof
+
+        while True:
+            match = _spoiler_token.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                if not fill():
+                    break
+                continue
+            pos = match.start()
+            token = buffer[pos]
+            if token != '"':
+                depth += 1 if token in '{[' else -1
+                pos += 1
+                continue
+            string = _spoiler_string.match(buffer, pos)
+            # A string cut off at the end of the block, or a key whose colon is in the next block
+            while (string is None or _json_whitespace.match(buffer, string.end()).end() == len(buffer)) and not eof:
+                fill()
+                string = _spoiler_string.match(buffer, pos)
+            if string is None:
+                break
+            pos = _json_whitespace.match(buffer, string.end()).end()
+            if depth == 1 and buffer.startswith(':', pos) and string.group() == '"settings"':
+                pos += 1
+                while True:
+                    pos = _json_whitespace.match(buffer, pos).end()
+                    try:
+                        return decoder.raw_decode(buffer, pos)[0]
+                    except json.JSONDecodeError:
+                        if not fill():
+                            raise
+    raise KeyError(f"No settings found in spoiler log {spoiler_filename}")
+
+
+def settings_sidecar_filename(spoiler_filename):
+    return spoiler_filename[:-len(SPOILER_SUFFIX)] + SETTINGS_SIDECAR_SUFFIX
+
+
+def write_settings_sidecars(randomizer_log):
+    """ Save the settings of each spoiler log the randomizer reported creating next to it. """
+    for spoiler_filename in _spoiler_log_line.findall(randomizer_log):
+        spoiler_filename = spoiler_filename.strip()
+        if not spoiler_filename.endswith(SPOILER_SUFFIX) or not os.path.isfile(spoiler_filename):
+            continue
+        with open(settings_sidecar_filename(spoiler_filename), 'w') as fout:
+            json.dump({"settings": read_spoiler_settings(spoiler_filename)}, fout, separators=(',', ':'))
+
+
+ROM_EXTENSIONS = [".n64", ".N64", ".z64", ".Z64"]
+ROM_CACHE_FILE = os.path.join('data', 'rom_cache.json')
+DECOMPRESSED_ROM_DIR = os.path.join('data', 'rom_cache')
+# Directories written by this script that never hold the user's rom
+ROM_SEARCH_SKIP = {'data', 'patches', 'failed_settings', 'randomizer', 'randomizer_versions', '.git'}
+
+COMPRESSED_ROM_SIZE = 0x2000000
+DECOMPRESSED_ROM_SIZE = 0x4000000
+BIG_ENDIAN_ROM_MAGIC = b'\x80\x37\x12\x40'
+
+
+def _load_rom_cache():
+    if os.path.isfile(ROM_CACHE_FILE):
+        with open(ROM_CACHE_FILE) as fin:
+            return json.load(fin)
+    return {}
+
+
+def _save_rom_cache(cache):
+    os.makedirs('data', exist_ok=True)
+    with open(ROM_CACHE_FILE, 'w') as fout:
+        json.dump(cache, fout, indent=4)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def _stamp_matches(stamp):
+    return stamp is not None and os.path.isfile(stamp["path"]) and _file_stamp(stamp["path"]) == stamp
+
+
+def find_rom_file(rom=None):
+    """ Find the Ocarina of Time rom file stored by the user in this directory.
+    An explicit rom path is used as given. Otherwise the last rom found is reused while its
+    modification time and size are unchanged, and the directory is only searched when it isn't. """
+    if rom is not None:
+        if not os.path.isfile(rom):
+            raise FileNotFoundError(f"RSL GENERATOR ERROR: CANNOT FIND THE SPECIFIED ROM FILE:\n{os.path.abspath(rom)}")
+        return os.path.abspath(rom)
+
+    cache = _load_rom_cache()
+    if _stamp_matches(cache.get("rom")):
+        return cache["rom"]["path"]
+
+    # Search once, keeping the preference order of the extensions
+    found = {ext: [] for ext in ROM_EXTENSIONS}
+    for dirpath, dirnames, filenames in os.walk(os.getcwd()):
+        if dirpath == os.getcwd():
+            dirnames[:] = [d for d in dirnames if d not in ROM_SEARCH_SKIP]
+        for filename in filenames:
+            ext = os.path.splitext(filename)[1]
+            if ext in found:
+                found[ext].append(os.path.join(dirpath, filename))
+    rom_filename = next((sorted(paths)[0] for paths in found.values() if paths), None)
 
     # No rom file found
-    if len(rom_filename) == 0:
+    if rom_filename is None:
         raise FileNotFoundError("RSL GENERATOR ERROR: NO .n64 or .z64 ROM FILE FOUND.")
-    return rom_filename[0]
+    cache["rom"] = _file_stamp(rom_filename)
+    _save_rom_cache(cache)
+    return rom_filename
+
+
+def _decompressor_path():
+    """ The randomizer's Decompress binary for this platform, chosen the same way the randomizer does. """
+    machine = platform.uname()[4]
+    if platform.system() == 'Windows':
+        name = "Decompress.exe" if 8 * struct.calcsize("P") == 64 else "Decompress32.exe"
+    elif platform.system() == 'Linux':
+        if machine in ['aarch64', 'arm64']:
+            name = "Decompress_ARM64"
+        elif machine == 'armv7l':
+            name = "Decompress_ARM32"
+        else:
+            name = "Decompress"
+    elif platform.system() == 'Darwin':
+        name = "Decompress_ARM64.out" if machine == 'arm64' else "Decompress.out"
+    else:
+        return None
+    return os.path.join("randomizer", "bin", "Decompress", name)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Roms already verified by this process
+_verified_roms = {}
+
+
+def prepare_rom(rom_filename):
+    """ Give the randomizer a decompressed rom so it doesn't decompress it again for every seed.
+    The decompressed copy is kept in data/rom_cache with its checksum, which is verified once per
+    process. Anything other than a compressed big-endian rom is returned unchanged. """
+    if rom_filename in _verified_roms:
+        return _verified_roms[rom_filename]
+
+    with open(rom_filename, 'rb') as fin:
+        magic = fin.read(4)
+    if magic != BIG_ENDIAN_ROM_MAGIC or os.path.getsize(rom_filename) != COMPRESSED_ROM_SIZE:
+        _verified_roms[rom_filename] = rom_filename
+        return rom_filename
+
+    cache = _load_rom_cache()
+    source = _file_stamp(rom_filename)
+    entry = cache.get("decompressed")
+    if (entry is not None and entry["source"] == source and os.path.isfile(entry["path"])
+            and _sha256(entry["path"]) == entry["sha256"]):
+        _verified_roms[rom_filename] = entry["path"]
+        return entry["path"]
+
+    decompressor = _decompressor_path()
+    decompressed = os.path.abspath(os.path.join(DECOMPRESSED_ROM_DIR, "ZOOTDEC.z64"))
+    os.makedirs(DECOMPRESSED_ROM_DIR, exist_ok=True)
+    if decompressor is None or not os.path.isfile(decompressor):
+        _verified_roms[rom_filename] = rom_filename
+        return rom_filename
+    completed_process = subprocess.run([decompressor, rom_filename, decompressed], capture_output=True)
+    if completed_process.returncode != 0 or not os.path.isfile(decompressed) or os.path.getsize(decompressed) != DECOMPRESSED_ROM_SIZE:
+        # Let the randomizer decompress it instead
+        print("RSL GENERATOR: COULD NOT DECOMPRESS THE ROM AHEAD OF TIME, THE RANDOMIZER WILL DECOMPRESS IT FOR EACH SEED.")
+        _verified_roms[rom_filename] = rom_filename
+        return rom_filename
+
+    cache["decompressed"] = {"source": source, "path": decompressed, "sha256": _sha256(decompressed)}
+    _save_rom_cache(cache)
+    _verified_roms[rom_filename] = decompressed
+    return decompressed
 
 
 # Compare weights file to settings list to check for changes to the randomizer settings table
@@ -107,8 +332,123 @@ def check_for_setting_changes(weights, randomizer_settings):
                 print(f"{setting} option {name} is new!\n")
 
 
-def benchmark_weights(weight_options, weight_dict, weight_multiselect):
+BENCHMARK_CACHE_FILE = os.path.join('data', 'benchmark_cache.json')
+BENCHMARK_CACHE_FORMAT = 1
+# Below this many new spoilers, starting worker processes costs more than it saves
+BENCHMARK_PARALLEL_MIN = 200
+
+
+def _spoiler_settings(filename):
+    """ The settings of a spoiler log, with options formatted the way the weights files write them.
+    A settings sidecar at least as new as the spoiler is read instead of the spoiler itself. """
+    sidecar = settings_sidecar_filename(filename)
+    if os.path.isfile(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(filename):
+        with open(sidecar) as sidecar_file:
+            spoiler_settings = json.load(sidecar_file)["settings"]
+    else:
+        spoiler_settings = read_spoiler_settings(filename)
+    return {setting_name: format_setting_option(option_value) for setting_name, option_value in spoiler_settings.items()}
+
+
+def format_setting_option(option_value):
+    """ Format a setting value the way the weights files write its options. """
+    if isinstance(option_value, list):
+        setting_option = option_value
+    elif not isinstance(option_value, str):
+        setting_option = str(option_value)
+    else:
+        setting_option = option_value
+    if isinstance(option_value, bool):
+        setting_option = setting_option.lower()
+    return setting_option
+
+
+def _load_benchmark_cache():
+    if os.path.isfile(BENCHMARK_CACHE_FILE):
+        with open(BENCHMARK_CACHE_FILE) as fin:
+            cache = json.load(fin)
+        if cache.get("format") == BENCHMARK_CACHE_FORMAT:
+            return cache
+    return {"format": BENCHMARK_CACHE_FORMAT, "values": [], "totals": [], "files": {}}
+
+
+def _save_benchmark_cache(cache):
+    os.makedirs('data', exist_ok=True)
+    tmp_filename = BENCHMARK_CACHE_FILE + '.tmp'
+    with open(tmp_filename, 'w') as fout:
+        json.dump(cache, fout, separators=(',', ':'))
+    os.replace(tmp_filename, BENCHMARK_CACHE_FILE)
+
+
+def count_spoiler_settings(patches_dir="patches", jobs=None):
+    """ Count how many spoiler logs have each setting value, only parsing spoilers that are new or
+    changed since the last run. Every distinct (setting, value) pair is stored once in
+    data/benchmark_cache.json with its total, and each spoiler keeps the ids of its pairs so
+    changed or deleted spoilers can be taken back out of the totals.
+    Returns the number of spoilers and a list of (setting, value, seed count). """
+    cache = _load_benchmark_cache()
+    values, totals, files = cache["values"], cache["totals"], cache["files"]
+    value_ids = {json.dumps(value): value_id for value_id, value in enumerate(values)}
+
+    spoilers = {}
+    for filename in glob.glob(os.path.join(patches_dir, "*_Spoiler.json")):
+        stat = os.stat(filename)
+        spoilers[os.path.basename(filename)] = [stat.st_mtime_ns, stat.st_size]
+
+    # Take deleted and changed spoilers out of the totals
+    removed = 0
+    for name in list(files):
+        if spoilers.get(name) != files[name][:2]:
+            for value_id in files.pop(name)[2]:
+                totals[value_id] -= 1
+            removed += 1
+    new_spoilers = [name for name in spoilers if name not in files]
+
+    def add_spoiler(name, settings):
+        ids = []
+        for setting_name, setting_option in settings.items():
+            key = json.dumps([setting_name, setting_option])
+            if key not in value_ids:
+                value_ids[key] = len(values)
+                values.append([setting_name, setting_option])
+                totals.append(0)
+            totals[value_ids[key]] += 1
+            ids.append(value_ids[key])
+        files[name] = spoilers[name] + [ids]
+
+    print(f"Processing spoilers: {len(new_spoilers)} new or changed, {len(files)} already counted")
+    paths = [os.path.join(patches_dir, name) for name in new_spoilers]
+    if len(paths) >= BENCHMARK_PARALLEL_MIN and jobs != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = executor.map(_spoiler_settings, paths, chunksize=64)
+            for fcount, (name, settings) in enumerate(zip(new_spoilers, parsed), 1):
+                add_spoiler(name, settings)
+                sys.stdout.write("\r%d / %d   " % (fcount, len(paths)))
+    else:
+        for fcount, (name, path) in enumerate(zip(new_spoilers, paths), 1):
+            add_spoiler(name, _spoiler_settings(path))
+            sys.stdout.write("\r%d / %d   " % (fcount, len(paths)))
+
+    if new_spoilers or removed or not os.path.isfile(BENCHMARK_CACHE_FILE):
+        _save_benchmark_cache(cache)
+    return len(files), [(setting_name, setting_option, total) for (setting_name, setting_option), total in zip(values, totals) if total > 0]
+
+
+def benchmark_weights(weight_options, weight_dict, weight_multiselect, jobs=None):
     """ Compare weights file definition to empirical data from generated spoiler logs. """
+    settings_counts, geometric_multis = init_settings_counts(weight_options, weight_dict, weight_multiselect)
+
+    # Count instances of each setting option in pre-rolled seeds.
+    # Use the --stress_test option to bulk generate seeds.
+    ftotal, setting_values = count_spoiler_settings(jobs=jobs)
+    tally_settings_counts(settings_counts, geometric_multis, ftotal, setting_values)
+    write_weights_report(settings_counts, ftotal)
+
+
+def init_settings_counts(weight_options, weight_dict, weight_multiselect):
+    """ Build the table of expected weights that seed counts are compared against.
+    Returns the table and the names of the geometric multiselects, which are counted by length. """
     # Initialize weight comparison object
     settings_counts = {}
     geometric_multis = []
@@ -146,7 +486,16 @@ def benchmark_weights(weight_options, weight_dict, weight_multiselect):
                     settings_counts[setting_name][setting_option]["normalized_weight"] = float(option_weight / option_total * (1 - conditional_mod))
     for setting_name, multi_options in weight_multiselect.items():
         settings_counts[setting_name] = {"disabled_seeds": 0}
-        if not multi_options["geometric"]:
+        if isinstance(multi_options, (int, float)):
+            # Current weights files give one chance of enabling every option of the multiselect
+            for setting_option in ms_option_lookup[setting_name]:
+                settings_counts[setting_name][setting_option] = {
+                    "weight": str(multi_options) + "%",
+                    "total_seeds": 0,
+                    "normalized_weight": float(multi_options / 100),
+                    "fraction_seeds": 0
+                }
+        elif not multi_options["geometric"]:
             for setting_option, option_pct in multi_options["opt_percentage"].items():
                 settings_counts[setting_name][setting_option] = {
                     "weight": str(option_pct) + "% (global " + str(multi_options["global_enable_percentage"]) + "%)",
@@ -156,7 +505,7 @@ def benchmark_weights(weight_options, weight_dict, weight_multiselect):
                 }
         else:
             geometric_multis.append(setting_name)
-            max_options = len(SettingInfos.setting_infos[setting_name].choices)
+            max_options = len(get_schema().setting_infos[setting_name].choices)
             for option_num in range(0, max_options+1):
                 settings_counts[setting_name][option_num] = {
                     "weight": str(2**(max_options - option_num)) + " (global " + str(multi_options["global_enable_percentage"]) + "%)",
@@ -165,50 +514,61 @@ def benchmark_weights(weight_options, weight_dict, weight_multiselect):
                     "fraction_seeds": 0
                 }
 
-    # Count instances of each setting option in pre-rolled seeds.
-    # Use the --stress_test option to bulk generate seeds.
-    print("Processing spoilers")
-    fcount = 0
-    ftotal = len(glob.glob(os.path.join("patches", "*_Spoiler.json")))
-    for filename in glob.glob(os.path.join("patches", "*_Spoiler.json")):
-        fcount = fcount + 1
-        afile = filename.split("_")
-        settings_hash = afile[1]
-        seed = afile[2]
-        sys.stdout.write("\r%d / %d: %s   " % (fcount, ftotal, (settings_hash + "_" + seed)))
-        with open(filename) as sp_file:
-            sp = json.load(sp_file)
-            for setting_name, option_value in sp["settings"].items():
-                if isinstance(option_value, list):
-                    setting_option = option_value
-                elif not isinstance(option_value, str):
-                    setting_option = str(option_value)
-                else:
-                    setting_option = option_value
-                if isinstance(option_value, bool):
-                    setting_option = setting_option.lower()
-                if setting_name in settings_counts.keys() and setting_name not in geometric_multis:
-                    if isinstance(setting_option, list):
-                        for o in setting_option:
-                            settings_counts[setting_name][o]["total_seeds"] += 1
-                    else:
-                        settings_counts[setting_name][setting_option]["total_seeds"] += 1
-                if setting_name in settings_counts.keys() and setting_name in geometric_multis:
-                    settings_counts[setting_name][len(setting_option)]["total_seeds"] += 1
-            # If the setting is disabled, it won't be in the spoiler log and skews the seed fraction.
-            for setting_name in settings_counts.keys():
-                if setting_name not in sp["settings"].keys():
-                    settings_counts[setting_name]["disabled_seeds"] += 1
+    return settings_counts, geometric_multis
+
+
+def tally_settings_counts(settings_counts, geometric_multis, ftotal, setting_values, intervals=True):
+    """ Add (setting, value, seed count) totals from ftotal seeds to the weights table, along with
+    the fraction of seeds with each option and its 95% confidence interval. Exact rates can be
+    tallied as counts out of ftotal=1, without intervals. """
+    seeds_with_setting = {}
+    for setting_name, setting_option, total in setting_values:
+        if setting_name not in settings_counts:
+            continue
+        seeds_with_setting[setting_name] = seeds_with_setting.get(setting_name, 0) + total
+        if setting_name in geometric_multis:
+            options = [len(setting_option)]
+        elif isinstance(setting_option, list):
+            options = setting_option
+        else:
+            options = [setting_option]
+        for option in options:
+            if option not in settings_counts[setting_name]:
+                # Options without a weight can still be set by conditionals
+                settings_counts[setting_name][option] = {"weight": 0, "total_seeds": 0, "normalized_weight": 0.0, "fraction_seeds": 0}
+            settings_counts[setting_name][option]["total_seeds"] += total
+    # If the setting is disabled, it won't be in the spoiler log and skews the seed fraction.
+    for setting_name in settings_counts.keys():
+        settings_counts[setting_name]["disabled_seeds"] = ftotal - seeds_with_setting.get(setting_name, 0)
     for setting_name, setting_options in settings_counts.items():
         for setting_option, option_data in setting_options.items():
             if setting_option != 'disabled_seeds':
                 if ftotal != settings_counts[setting_name]["disabled_seeds"]:
-                    settings_counts[setting_name][setting_option]["fraction_seeds"] = float(option_data["total_seeds"] / (ftotal - settings_counts[setting_name]["disabled_seeds"]))
+                    enabled_seeds = ftotal - settings_counts[setting_name]["disabled_seeds"]
+                    settings_counts[setting_name][setting_option]["fraction_seeds"] = float(option_data["total_seeds"] / enabled_seeds)
+                    if intervals:
+                        settings_counts[setting_name][setting_option]["interval"] = wilson_interval(option_data["total_seeds"], enabled_seeds)
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """ The Wilson score interval for a binomial proportion, 95% by default. """
+    if trials == 0:
+        return (0.0, 1.0)
+    p = successes / trials
+    denominator = 1 + z**2 / trials
+    center = (p + z**2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
 
+def write_weights_report(settings_counts, ftotal, report_filename="weights_report.html", title="Random Settings Weights Verification", summary=None):
+    """ Write the weights table as an html report. """
     # Create report
     print("\nExporting weights report")
-    report = '<!DOCTYPE html><html><head><style>body {font-family: sans-serif;} .setting_container {border-bottom: 1px solid #666; padding: 24px;} .setting_name {font-size: 1.5em; font-weight: bold; margin: 8px 0px} .option_error {background-color: red; color: white;} .option_alert {background-color: yellow;} .setting_disabled {color: #AAA;} .option_row td {padding-right: 16px;} .option_header {font-weight: bold;}</style></head><body><h1>Random Settings Weights Verification</h1>'
+    report = '<!DOCTYPE html><html><head><style>body {font-family: sans-serif;} .setting_container {border-bottom: 1px solid #666; padding: 24px;} .setting_name {font-size: 1.5em; font-weight: bold; margin: 8px 0px} .option_error {background-color: red; color: white;} .option_alert {background-color: yellow;} .option_outside_interval td:last-child, .interval_legend {font-weight: bold;} .setting_disabled {color: #AAA;} .option_row td {padding-right: 16px;} .option_header {font-weight: bold;}</style></head><body><h1>' + title + '</h1>'
+    report += '<div>' + (summary if summary is not None else str(ftotal) + ' seeds') + '</div>'
     report += '<div class="option_alert">Yellow options deviate from weights by >10%</div>'
+    report += '<div class="interval_legend">Bold intervals do not contain the normalized weight</div>'
     report += '<div class="option_error">Red options are not found in any seed despite non-zero weight</div>'
     report += '<div class="setting_disabled">Grayed-out options are not found in any seeds, likely disabled by another setting</div>'
     for setting_name, setting_options in settings_counts.items():
@@ -222,6 +582,7 @@ def benchmark_weights(weight_options, weight_dict, weight_multiselect):
                   '<td>Total Seeds</td>' + \
                   '<td>Normalized Weight</td>' + \
                   '<td>Fraction Seeds</td>' + \
+                  '<td>95% Interval</td>' + \
                   '</tr>'
         for setting_option, option_data in setting_options.items():
             if setting_option != 'disabled_seeds':
@@ -231,18 +592,25 @@ def benchmark_weights(weight_options, weight_dict, weight_multiselect):
                 if (abs(option_data["fraction_seeds"] - option_data["normalized_weight"]) > option_data["normalized_weight"] / 10 and
                 option_data["normalized_weight"] != 0 and option_data["total_seeds"] != 0):
                     option_class += " option_alert"
+                interval = ""
+                if "interval" in option_data:
+                    low, high = option_data["interval"]
+                    interval = f"{low:.4f} - {high:.4f}"
+                    if not low <= option_data["normalized_weight"] <= high and option_data["normalized_weight"] != 0:
+                        option_class += " option_outside_interval"
                 report += '<tr class="'+str(option_class)+'">' + \
                         '<td>'+str(setting_option)+'</td>' + \
                         '<td>'+str(option_data["weight"])+'</td>' + \
                         '<td>'+str(option_data["total_seeds"])+'</td>' + \
                         '<td>'+str(option_data["normalized_weight"])+'</td>' + \
                         '<td>'+str(option_data["fraction_seeds"])+'</td>' + \
+                        '<td>'+interval+'</td>' + \
                         '</tr>'
         report += '</table></div>'
     report += "</body></html>"
-    with open("weights_report.html", "w") as report_file:
+    with open(report_filename, "w") as report_file:
         report_file.writelines(report)
-    sys.stdout.write("Report created as %s" % (os.path.abspath("weights_report.html")))
+    sys.stdout.write("Report created as %s" % (os.path.abspath(report_filename)))
 
 
 class RandomizerError(Exception):
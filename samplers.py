@@ -0,0 +1,83 @@
+""" Precomputed samplers for drawing setting options from a weights profile. """
+import random
+
+
+class CategoricalSampler:
+    """ Draws weighted options in constant time using a Walker alias table. """
+
+    def __init__(self, options, weights):
+        self.options = tuple(options)
+        self.weights = tuple(weights)
+        total = sum(self.weights)
+        if len(self.options) == 0 or total <= 0:
+            raise ValueError(f"Cannot draw from options {list(self.options)} with weights {list(self.weights)}")
+
+        # Build the alias table. Each slot keeps its own option with probability prob[i]
+        # and otherwise hands the draw to alias[i].
+        count = len(self.weights)
+        scaled = [weight * count / total for weight in self.weights]
+        self._prob = [1.0] * count
+        self._alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        self._without = {}
+
+    def draw(self, rng=random):
+        """ Draw one option. """
+        x = rng.random() * len(self._prob)
+        i = int(x)
+        if x - i < self._prob[i]:
+            return self.options[i]
+        return self.options[self._alias[i]]
+
+    def without(self, excluded):
+        """ A sampler over the remaining options, cached so repeated exclusions cost a lookup. """
+        excluded = frozenset(option for option in excluded if option in self.options)
+        if not excluded:
+            return self
+        if excluded not in self._without:
+            kept = [(option, weight) for option, weight in zip(self.options, self.weights) if option not in excluded]
+            self._without[excluded] = CategoricalSampler([o for o, _ in kept], [w for _, w in kept])
+        return self._without[excluded]
+
+
+class UniformIntSampler:
+    """ Draws every integer from minimum to maximum with even weight, without building a table. """
+
+    def __init__(self, minimum, maximum):
+        if maximum < minimum:
+            raise ValueError(f"Cannot draw an integer between {minimum} and {maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.options = range(minimum, maximum + 1)
+        self._without = {}
+
+    @property
+    def weights(self):
+        return (100. / len(self.options),) * len(self.options)
+
+    def draw(self, rng=random):
+        """ Draw one integer. """
+        return self.minimum + int(rng.random() * len(self.options))
+
+    def without(self, excluded):
+        """ A sampler over the remaining integers. """
+        excluded = frozenset(option for option in excluded if option in self.options)
+        if not excluded:
+            return self
+        if excluded not in self._without:
+            kept = [option for option in self.options if option not in excluded]
+            if kept and kept[-1] - kept[0] + 1 == len(kept):
+                self._without[excluded] = UniformIntSampler(kept[0], kept[-1])
+            else:
+                self._without[excluded] = CategoricalSampler(kept, [1] * len(kept))
+        return self._without[excluded]
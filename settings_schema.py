@@ -0,0 +1,143 @@
+""" A snapshot of the parts of the randomizer's settings tables that this script uses, so that
+rolling settings does not need to import the randomizer. The snapshot is built from the
+randomizer once after it is downloaded and rebuilt whenever it is stale. """
+import os
+import sys
+import json
+import rslversion as rslv
+
+SCHEMA_FILENAME = 'rsl_schema.json'
+SCHEMA_FORMAT = 1
+
+# Tabs listed by generate_balanced_weights
+SCHEMA_TABS = ["main_tab", "detailed_tab", "other_tab", "starting_tab"]
+
+TYPE_NAMES = {bool: "bool", int: "int", str: "str", list: "list", dict: "dict"}
+TYPES = {name: setting_type for setting_type, name in TYPE_NAMES.items()}
+
+
+class SettingSchema:
+    """ The fields of a randomizer SettingInfo used by this script. The disable rules have
+    their sections and tabs already expanded into 'settings' lists. """
+    __slots__ = ("name", "type", "choices", "default", "disable")
+
+    def __init__(self, name, setting_type, choices, default, disable):
+        self.name = name
+        self.type = setting_type
+        self.choices = choices
+        self.default = default
+        self.disable = disable
+
+
+class RandomizerSchema:
+    """ Settings, tabs and starting item tables loaded from a schema snapshot. """
+
+    def __init__(self, data):
+        self.randomizer_commit = data["randomizer_commit"]
+        self.setting_infos = {
+            name: SettingSchema(
+                name,
+                TYPES.get(entry["type"], entry["type"]),
+                {choice: choice for choice in entry["choices"]},
+                entry["default"],
+                {option: {'settings': disabled} for option, disabled in entry["disable"]} if "disable" in entry else None,
+            )
+            for name, entry in data["settings"].items()
+        }
+        self.tabs = data["tabs"]
+        self.inventory = data["starting_items"]["inventory"]
+        self.songs = data["starting_items"]["songs"]
+        self.equipment = data["starting_items"]["equipment"]
+        self.trade_items = frozenset(data["trade_items"])
+        self.child_trade_items = frozenset(data["child_trade_items"])
+
+    def settings_from_tab(self, tab):
+        return self.tabs[tab]
+
+
+def schema_path(randomizer_dir='randomizer'):
+    return os.path.join(randomizer_dir, SCHEMA_FILENAME)
+
+
+def build_schema():
+    """ Import the randomizer and extract the schema from its settings tables. """
+    sys.path.append("randomizer")
+    from randomizer.SettingsList import SettingInfos, get_settings_from_tab, get_settings_from_section
+    from randomizer.ItemPool import trade_items, child_trade_items
+    from randomizer.StartingItems import inventory, songs, equipment
+
+    settings = {}
+    for name, info in SettingInfos.setting_infos.items():
+        entry = {
+            "type": TYPE_NAMES.get(info.type, getattr(info.type, "__name__", str(info.type))),
+            "choices": list(info.choices.keys()),
+            "default": info.default,
+        }
+        if info.disable is not None:
+            entry["disable"] = []
+            for option, disabling in info.disable.items():
+                disabled = list(disabling.get('settings', []))
+                for section in disabling.get('sections', []):
+                    disabled += get_settings_from_section(section)
+                for tab in disabling.get('tabs', []):
+                    disabled += get_settings_from_tab(tab)
+                entry["disable"].append([option, list(dict.fromkeys(disabled))])
+        settings[name] = entry
+
+    return {
+        "format": SCHEMA_FORMAT,
+        "randomizer_commit": rslv.randomizer_commit,
+        "randomizer_version": rslv.randomizer_version,
+        "settings": settings,
+        "tabs": {tab: list(get_settings_from_tab(tab)) for tab in SCHEMA_TABS},
+        "starting_items": {
+            "inventory": {name: info.item_name for name, info in inventory.items()},
+            "songs": {name: info.item_name for name, info in songs.items()},
+            "equipment": {name: info.item_name for name, info in equipment.items()},
+        },
+        "trade_items": list(trade_items),
+        "child_trade_items": list(child_trade_items),
+    }
+
+
+def write_schema(randomizer_dir='randomizer'):
+    """ Build the schema from the installed randomizer and save it next to it. """
+    data = build_schema()
+    with open(schema_path(randomizer_dir), 'w') as fout:
+        # Defaults that aren't plain JSON (none are used by this script) are saved as strings
+        json.dump(data, fout, separators=(',', ':'), default=str)
+    return data
+
+
+def is_stale(data):
+    """ Whether a loaded schema was built for a different randomizer commit or schema format. """
+    return data.get("format") != SCHEMA_FORMAT or data.get("randomizer_commit") != rslv.randomizer_commit
+
+
+def read_schema(randomizer_dir='randomizer'):
+    """ Load the schema snapshot, rebuilding it from the randomizer if it is missing or stale. """
+    data = None
+    if os.path.isfile(schema_path(randomizer_dir)):
+        with open(schema_path(randomizer_dir)) as fin:
+            data = json.load(fin)
+    if data is None or is_stale(data):
+        data = write_schema(randomizer_dir)
+    return RandomizerSchema(data)
+
+
+_schema = None
+
+
+def get_schema():
+    """ The randomizer schema for this process, loaded on first use. """
+    global _schema
+    if _schema is None:
+        _schema = read_schema()
+    return _schema
+
+
+def set_schema(data):
+    """ Use schema data that didn't come from the installed randomizer, e.g. the benchmarks' stub. """
+    global _schema
+    _schema = RandomizerSchema(data)
+    return _schema
@@ -0,0 +1,93 @@
+""" Offline Monte Carlo check of a weights file. Settings are rolled with the same sampling,
+multiselects, conditionals and redundant setting removal as a real seed, but the randomizer
+is never run, so the --benchmark report can be built from millions of draws in minutes.
+With NumPy installed the draws are rolled in batches by batch_settings, which is much faster. """
+import sys
+import time
+import random
+import roll_settings as rs
+import rsl_tools as tools
+import batch_settings
+from utils import seeded_rng
+
+SIMULATION_CHUNK = 5000
+BATCH_SIMULATION_CHUNK = 50000
+SIMULATION_REPORT = "weights_simulation_report.html"
+
+# Set in each simulation process by _init_simulation
+_sim_profile = None
+_sim_tracked = None
+
+
+def _init_simulation(profile):
+    global _sim_profile, _sim_tracked
+    _sim_profile = profile
+    _sim_tracked = frozenset(profile.weight_dict) | frozenset(profile.weight_multiselect or ())
+
+
+def _simulate_chunk(base_seed, chunk_index, draws, batch=False):
+    """ Roll draws sets of settings and count each (setting, value) the report uses.
+    Each chunk has its own stream, so the totals don't depend on how chunks are spread over processes. """
+    if batch:
+        plandos = batch_settings.roll_batch(_sim_profile, draws, batch_settings.batch_rng(base_seed, "simulate", chunk_index))
+        return {(setting_name, option_value): count
+                for setting_name in _sim_tracked if setting_name in plandos
+                for option_value, count in plandos.value_counts(setting_name)}
+
+    rng = seeded_rng(base_seed, "simulate", chunk_index)
+    counts = {}
+    for _ in range(draws):
+        random_settings = rs.roll_random_settings(_sim_profile, rng=rng)
+        for setting_name, option_value in random_settings.items():
+            if setting_name not in _sim_tracked:
+                continue
+            key = (setting_name, tuple(option_value) if isinstance(option_value, list) else option_value)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def simulate_weights(profile, draws, jobs=1, rng_seed=None):
+    """ Roll draws sets of settings from a WeightsProfile without running the randomizer and
+    write the same per-option report as --benchmark, with 95% confidence intervals. """
+    if rng_seed is None:
+        rng_seed = random.SystemRandom().getrandbits(64)
+    try:
+        batch_settings.load_numpy()
+        batch = True
+    except ModuleNotFoundError:
+        print("RSL GENERATOR: NUMPY IS NOT INSTALLED, SIMULATING ONE SEED AT A TIME. INSTALL NUMPY FOR FASTER SIMULATIONS.")
+        batch = False
+    print(f"RSL GENERATOR: SIMULATING {draws} SEEDS WITH RNG SEED {rng_seed}")
+
+    chunk_size = BATCH_SIMULATION_CHUNK if batch else SIMULATION_CHUNK
+    chunks = [(i, min(chunk_size, draws - start)) for i, start in enumerate(range(0, draws, chunk_size))]
+    start_time = time.perf_counter()
+    totals = {}
+    done = 0
+
+    def merge(counts, chunk_draws):
+        nonlocal done
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+        done += chunk_draws
+        sys.stdout.write("\r%d / %d   " % (done, draws))
+
+    if jobs == 1:
+        _init_simulation(profile)
+        for chunk_index, chunk_draws in chunks:
+            merge(_simulate_chunk(rng_seed, chunk_index, chunk_draws, batch), chunk_draws)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_simulation, initargs=(profile,)) as executor:
+            results = executor.map(_simulate_chunk, [rng_seed] * len(chunks), *zip(*chunks), [batch] * len(chunks))
+            for (_, chunk_draws), counts in zip(chunks, results):
+                merge(counts, chunk_draws)
+    elapsed = time.perf_counter() - start_time
+    print(f"\nRSL GENERATOR: SIMULATED {draws} SEEDS IN {elapsed:.1f} SECONDS ({draws / elapsed:.0f} PER SECOND)")
+
+    settings_counts, geometric_multis = tools.init_settings_counts(profile.weight_options, profile.weight_dict, profile.weight_multiselect)
+    # Values are only formatted like spoiler options once here, instead of once per draw
+    setting_values = [(setting_name, tools.format_setting_option(list(option_value) if isinstance(option_value, tuple) else option_value), total)
+                      for (setting_name, option_value), total in totals.items()]
+    tools.tally_settings_counts(settings_counts, geometric_multis, draws, setting_values)
+    tools.write_weights_report(settings_counts, draws, SIMULATION_REPORT, "Random Settings Weights Simulation")
@@ -0,0 +1,43 @@
+""" Checks validate_plando against the stub schema from the benchmarks, so the randomizer
+doesn't have to be downloaded. Run from the repository root with python -m unittest. """
+import os
+import json
+import unittest
+import settings_schema
+import roll_settings as rs
+
+STUB_SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stub_schema.json")
+
+
+class ValidatePlandoTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(STUB_SCHEMA) as fin:
+            settings_schema.set_schema(json.load(fin))
+        rs._disable_indexes.clear()
+
+    def test_valid_settings(self):
+        self.assertEqual(rs.validate_plando({"bridge": "tokens", "bridge_tokens": 20}), [])
+
+    def test_disabled_setting_at_non_default(self):
+        problems = rs.validate_plando({"bridge": "medallions", "bridge_tokens": 20})
+        self.assertEqual(problems, ["bridge_tokens is disabled by bridge='medallions' but set to 20"])
+
+    def test_disabled_setting_at_default(self):
+        self.assertEqual(rs.validate_plando({"bridge": "medallions", "bridge_tokens": 0}), [])
+
+    def test_disabled_by_setting_left_at_default(self):
+        # bridge defaults to dungeons, which disables bridge_tokens
+        problems = rs.validate_plando({"bridge_tokens": 20})
+        self.assertEqual(problems, ["bridge_tokens is disabled by bridge='dungeons' but set to 20"])
+
+    def test_pruned_settings_are_valid(self):
+        random_settings = {"bridge": "medallions", "bridge_tokens": 20, "triforce_hunt": True, "triforce_goal_per_world": 20}
+        rs.remove_redundant_settings(random_settings)
+        self.assertEqual(random_settings, {"bridge": "medallions", "triforce_hunt": True, "triforce_goal_per_world": 20})
+        self.assertEqual(rs.validate_plando(random_settings), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+""" Wall-clock timers for the phases of a seed run. Phases are only timed while a collect() block
+is active in the current thread, so the timers cost next to nothing otherwise. """
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Phases in the order they happen, for reports
+PHASES = ["weights_load", "rom_discovery", "sampling", "conditionals", "remove_redundant", "plando_write",
+          "randomizer_startup", "randomizer"]
+
+_current = contextvars.ContextVar("phase_times", default=None)
+
+
+class PhaseTimes:
+    """ Total seconds and number of runs of each phase. """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def current():
+    """ The PhaseTimes being collected in this thread, if any. """
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """ Time every phase run inside the block into a new PhaseTimes. """
+    times = PhaseTimes()
+    token = _current.set(times)
+    try:
+        yield times
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """ Time the block as one run of a phase. """
+    times = _current.get()
+    if times is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times.add(name, time.perf_counter() - start)
+
+
+def write_record(filename, record_data):
+    """ Append one JSON line to a timing log. """
+    if filename is None:
+        return
+    with open(filename, 'a') as fout:
+        fout.write(json.dumps(record_data) + "\n")
+
+
+def _rounded(times):
+    return {name: round(seconds, 6) for name, seconds in times.seconds.items()}
+
+
+def setup_record(times):
+    """ The timing log line for loading everything shared by the seeds. """
+    return {"setup": True, "phases": _rounded(times)}
+
+
+def seed_record(seed_index, times, success):
+    """ The timing log line for one seed, with the total time and number of runs of each phase. """
+    return {"seed": seed_index + 1, "success": success, "phases": _rounded(times), "counts": times.counts}
+
+
+def percentile(values, p):
+    """ The p-th percentile of sorted values, interpolating between the closest ranks. """
+    if len(values) == 1:
+        return values[0]
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def print_summary(records):
+    """ Print the p50/p95/p99 of every phase over seed records, in milliseconds. """
+    per_phase = {}
+    for record_data in records:
+        for name, seconds in record_data["phases"].items():
+            per_phase.setdefault(name, []).append(seconds * 1000)
+    if not per_phase:
+        return
+    print(f"RSL GENERATOR: PHASE TIMES OVER {len(records)} SEEDS (MS)")
+    print(f"{'phase':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'total':>12}")
+    order = PHASES + sorted(set(per_phase) - set(PHASES))
+    for name in order:
+        if name not in per_phase:
+            continue
+        values = sorted(per_phase[name])
+        print(f"{name:<20}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}{sum(values):>12.1f}")
@@ -1,16 +1,46 @@
 import os
+import re
 import sys
 import stat
-import zipfile
 import shutil
 import subprocess
 from utils import cleanup
 import rslversion as rslv
-try:
-    import requests
-except ModuleNotFoundError:
-    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
-    import requests
+import settings_schema
+
+# Written into the randomizer directory after a download so the version check is a single small read
+VERSION_MARKER = '.rsl_randomizer_commit'
+
+
+def import_requests():
+    """ Import requests only when something needs to be downloaded, installing it if needed. """
+    try:
+        import requests
+    except ModuleNotFoundError:
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
+        import requests
+    return requests
+
+
+def installed_randomizer_commit(randomizer_dir='randomizer'):
+    """ The randomizer commit recorded in the marker file, or None for installs without one. """
+    try:
+        with open(os.path.join(randomizer_dir, VERSION_MARKER)) as fin:
+            return fin.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def installed_randomizer_version(randomizer_dir='randomizer'):
+    """ Read the randomizer's version string without importing it. """
+    with open(os.path.join(randomizer_dir, 'version.py')) as fin:
+        match = re.search(r"""^__version__\s*=\s*['"]([^'"]*)['"]""", fin.read(), re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def write_version_marker(randomizer_dir='randomizer'):
+    with open(os.path.join(randomizer_dir, VERSION_MARKER), 'w') as fout:
+        fout.write(rslv.randomizer_commit)
 
 
 def check_python():
@@ -19,50 +49,309 @@ def check_python():
         sys.exit(1)
 
 def check_version():
-    """ Ensure the downloaded version of the randomizer is the correct, if not update """
-    if os.path.isfile(os.path.join('randomizer', 'version.py')):
-        from randomizer import version as ootrversion
-        if ootrversion.__version__ == rslv.randomizer_version:
+    """ Ensure the selected version of the randomizer is the correct one, if not switch to it or download it """
+    installed_commit = installed_randomizer_commit()
+    if installed_commit == rslv.randomizer_commit:
+        return
+    if os.path.isdir('randomizer') and not _is_link('randomizer'):
+        # Installs from before randomizer_versions: keep them as a version if we know which one they are
+        if installed_commit is None and os.path.isfile(os.path.join('randomizer', 'version.py')) \
+                and installed_randomizer_version() == rslv.randomizer_version:
+            write_version_marker()
+            installed_commit = rslv.randomizer_commit
+        migrate_randomizer_install(installed_commit)
+        if installed_commit == rslv.randomizer_commit:
             return
+
+    install = randomizer_install_path()
+    if installed_randomizer_commit(install) == rslv.randomizer_commit:
+        print(f"Switching to randomizer version {rslv.randomizer_version}")
+        select_randomizer(install)
+        return
+    if installed_commit is not None:
         print("Updating the randomizer...")
-        shutil.rmtree('randomizer')
-        download_randomizer()
     else:
         print("Downloading the randomizer...")
-        download_randomizer()
+    download_randomizer()
     return
 
 
+# Every downloaded version is installed in its own folder here and 'randomizer' links to the one in use
+RANDOMIZER_VERSIONS_DIR = 'randomizer_versions'
+RANDOMIZER_VERSIONS_KEEP = 3
+
+
+def randomizer_install_path(commit=rslv.randomizer_commit):
+    return os.path.join(RANDOMIZER_VERSIONS_DIR, commit)
+
+
+def _is_link(path):
+    """ Whether path is a symlink, or on Windows a junction. """
+    if os.path.islink(path):
+        return True
+    if os.name == 'nt':
+        try:
+            os.readlink(path)
+            return True
+        except (OSError, ValueError):
+            return False
+    return False
+
+
+def select_randomizer(install):
+    """ Point 'randomizer' at an installed version. """
+    # Marks the version as recently used for pruning
+    os.utime(os.path.join(install, VERSION_MARKER))
+    if os.name == 'nt':
+        # Symlinks need extra privileges on Windows, junctions don't
+        if _is_link('randomizer'):
+            os.rmdir('randomizer')
+        try:
+            os.symlink(install, 'randomizer', target_is_directory=True)
+        except OSError:
+            import _winapi
+            _winapi.CreateJunction(os.path.abspath(install), os.path.abspath('randomizer'))
+        return
+    # Replace the link in one step so nothing ever sees a missing randomizer
+    temp_link = 'randomizer.link'
+    if os.path.lexists(temp_link):
+        os.unlink(temp_link)
+    os.symlink(install, temp_link, target_is_directory=True)
+    os.replace(temp_link, 'randomizer')
+
+
+def migrate_randomizer_install(commit):
+    """ Move a randomizer folder from before randomizer_versions into it, or delete it if its version is unknown. """
+    install = randomizer_install_path(commit) if commit is not None else None
+    if install is None or os.path.isdir(install):
+        shutil.rmtree('randomizer')
+        return
+    os.makedirs(RANDOMIZER_VERSIONS_DIR, exist_ok=True)
+    os.rename('randomizer', install)
+    select_randomizer(install)
+
+
+def prune_randomizer_versions(keep=rslv.randomizer_commit):
+    """ Delete all but the most recently used installed versions. """
+    def last_used(commit):
+        try:
+            return os.path.getmtime(os.path.join(RANDOMIZER_VERSIONS_DIR, commit, VERSION_MARKER))
+        except FileNotFoundError:
+            # Incomplete installs go first
+            return 0
+    installs = sorted((name for name in os.listdir(RANDOMIZER_VERSIONS_DIR)
+                       if os.path.isdir(os.path.join(RANDOMIZER_VERSIONS_DIR, name)) and not name.endswith('.new')),
+                      key=last_used, reverse=True)
+    for name in installs[RANDOMIZER_VERSIONS_KEEP:]:
+        if name != keep:
+            shutil.rmtree(os.path.join(RANDOMIZER_VERSIONS_DIR, name))
+
+
+# Downloaded archives are kept here by commit, so switching back to an earlier version doesn't download it again
+RANDOMIZER_CACHE_DIR = os.path.join('data', 'randomizer_cache')
+RANDOMIZER_CACHE_KEEP = 3
+# A directory, base URL or zip file to get the randomizer from instead of GitHub, e.g. file:///mnt/mirror
+RANDOMIZER_SOURCE_ENV = 'RSL_RANDOMIZER_SOURCE'
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_ATTEMPTS = 3
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def randomizer_archive_url(commit=rslv.randomizer_commit):
+    """ Where to get the randomizer archive for a commit, GitHub unless RSL_RANDOMIZER_SOURCE says otherwise. """
+    source = os.environ.get(RANDOMIZER_SOURCE_ENV)
+    if not source:
+        return f'https://github.com/{rslv.randomizer_repo}/archive/{commit}.zip'
+    if source.endswith('.zip'):
+        return source
+    return source.rstrip('/') + f'/{commit}.zip'
+
+
+def cached_archive_path(commit=rslv.randomizer_commit):
+    return os.path.join(RANDOMIZER_CACHE_DIR, f'{commit}.zip')
+
+
+def _local_path(url):
+    """ The file a file:// URL or plain path points to, or None for remote URLs. """
+    if url.startswith('file://'):
+        from urllib.parse import urlparse
+        from urllib.request import url2pathname
+        return url2pathname(urlparse(url).path)
+    if '://' not in url:
+        return url
+    return None
+
+
+def _file_sha256(path):
+    import hashlib
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(DOWNLOAD_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _read_sha256_file(path):
+    """ The hash in a sha256sum style file: the first word. """
+    with open(path) as fin:
+        return fin.read().split()[0].lower()
+
+
+def _fetch_expected_sha256(url):
+    """ The hash a mirror publishes next to an archive as <archive>.sha256, or None if it doesn't. """
+    local = _local_path(url)
+    if local is not None:
+        return _read_sha256_file(local + '.sha256') if os.path.isfile(local + '.sha256') else None
+    if 'github.com' in url:
+        return None
+    requests = import_requests()
+    response = requests.get(url + '.sha256', timeout=30)
+    if response.status_code != 200:
+        return None
+    return response.text.split()[0].lower()
+
+
+def _download(url, part_path):
+    """ Download url into part_path, continuing from whatever a failed download left there. """
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+
+    local = _local_path(url)
+    if local is not None:
+        with open(local, 'rb') as fin, open(part_path, 'ab') as fout:
+            fin.seek(offset)
+            shutil.copyfileobj(fin, fout, DOWNLOAD_CHUNK_SIZE)
+        return
+
+    requests = import_requests()
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    with requests.get(url, stream=True, headers=headers, timeout=60) as response:
+        if response.status_code == 416:
+            # The partial download is already the whole file
+            return
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            # The server ignored the range, start over
+            offset = 0
+        expected = response.headers.get('Content-Length')
+        with open(part_path, 'ab' if offset else 'wb') as fout:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                fout.write(chunk)
+    if expected is not None and os.path.getsize(part_path) != offset + int(expected):
+        # Kept to resume from on the next attempt
+        raise ConnectionError(f"Download of {url} ended early")
+
+
+def verify_archive(path, commit=rslv.randomizer_commit, expected_sha256=None):
+    """ Check an archive's hash, if one is known, and the CRC of every file in it. """
+    import zipfile
+    if expected_sha256 is not None and _file_sha256(path) != expected_sha256:
+        raise ArchiveError(f"{path} does not match its sha256 hash")
+    try:
+        with zipfile.ZipFile(path) as zipped:
+            names = zipped.namelist()
+            if not names or not names[0].startswith(f'OoT-Randomizer-{commit}/'):
+                raise ArchiveError(f"{path} is not an archive of randomizer commit {commit}")
+            bad_file = zipped.testzip()
+    except zipfile.BadZipFile as ex:
+        raise ArchiveError(f"{path} is not a valid zip file: {ex}")
+    if bad_file is not None:
+        raise ArchiveError(f"{bad_file} is corrupt in {path}")
+
+
+def fetch_randomizer_archive(commit=rslv.randomizer_commit):
+    """ The path of a verified archive of the randomizer commit, downloading it if it isn't cached. """
+    archive = cached_archive_path(commit)
+    if os.path.isfile(archive):
+        try:
+            verify_archive(archive, commit, _read_sha256_file(archive + '.sha256') if os.path.isfile(archive + '.sha256') else None)
+            print("Using the cached randomizer download")
+            return archive
+        except ArchiveError as ex:
+            print(f"The cached randomizer download is damaged, downloading it again: {ex}")
+            cleanup(archive)
+
+    os.makedirs(RANDOMIZER_CACHE_DIR, exist_ok=True)
+    url = randomizer_archive_url(commit)
+    part = archive + '.part'
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        try:
+            _download(url, part)
+            verify_archive(part, commit, _fetch_expected_sha256(url))
+            break
+        except ArchiveError as ex:
+            # A bad archive can't be resumed, only downloaded again
+            cleanup(part)
+            error = ex
+        except Exception as ex:
+            # File and network errors, the partial download is kept to resume from
+            error = ex
+        print(f"Randomizer download attempt {attempt} of {DOWNLOAD_ATTEMPTS} failed: {error}")
+    else:
+        raise RuntimeError(f"RSL GENERATOR ERROR: COULD NOT DOWNLOAD THE RANDOMIZER FROM {url}: {error}")
+
+    # Remember the hash so later reuse of the cache can detect damage
+    with open(archive + '.sha256', 'w') as fout:
+        fout.write(f"{_file_sha256(part)}  {os.path.basename(archive)}\n")
+    os.replace(part, archive)
+    prune_randomizer_cache(keep=commit)
+    return archive
+
+
+def prune_randomizer_cache(keep=rslv.randomizer_commit):
+    """ Delete all but the most recently used cached archives. """
+    archives = sorted((path for path in os.listdir(RANDOMIZER_CACHE_DIR) if path.endswith('.zip')),
+                      key=lambda path: os.path.getmtime(os.path.join(RANDOMIZER_CACHE_DIR, path)), reverse=True)
+    for name in archives[RANDOMIZER_CACHE_KEEP:]:
+        if name != f'{keep}.zip':
+            cleanup(os.path.join(RANDOMIZER_CACHE_DIR, name))
+            cleanup(os.path.join(RANDOMIZER_CACHE_DIR, name + '.sha256'))
+
+
 def download_randomizer():
-    """ Download the randomizer from commit listed in version.py """
-    zippath = 'randomizer.zip'
-
-    # Make sure an old zip isn't sitting around
-    cleanup(zippath)
-
-    # Download the zipped randomizer
-    req = requests.get(f'https://github.com/{rslv.randomizer_repo}/archive/{rslv.randomizer_commit}.zip', stream=True)
-    with open(zippath, 'wb') as fin:
-        for chunk in req.iter_content():
-            fin.write(chunk)
-
-    # Extract the zip file and add __init__.py
-    with zipfile.ZipFile(zippath, 'r') as zipped:
-        zipped.extractall('.')
-    shutil.move(f'OoT-Randomizer-{rslv.randomizer_commit}', 'randomizer')
-    with open(os.path.join('randomizer', '__init__.py'), 'w') as fin:
+    """ Download the randomizer from commit listed in version.py, or take it from the download cache """
+    archive = fetch_randomizer_archive(rslv.randomizer_commit)
+    # Mark the archive as recently used for pruning
+    os.utime(archive)
+
+    # Extract next to the other versions and only add it once it is complete
+    import zipfile  # Only needed when updating, so kept off the startup path
+    import compileall
+    install = randomizer_install_path(rslv.randomizer_commit)
+    staging = install + '.new'
+    shutil.rmtree(staging, ignore_errors=True)
+    with zipfile.ZipFile(archive, 'r') as zipped:
+        zipped.extractall(staging)
+    extracted = os.path.join(staging, f'OoT-Randomizer-{rslv.randomizer_commit}')
+    with open(os.path.join(extracted, '__init__.py'), 'w') as fin:
         pass
 
     # Restore permissions in the unzipped randomizer
     for executable in [
-        os.path.join('randomizer', 'OoTRandomizer.py'),
-        os.path.join('randomizer', 'bin', 'Decompress', 'Decompress'),
-        os.path.join('randomizer', 'bin', 'Decompress', 'Decompress_ARM32'),
-        os.path.join('randomizer', 'bin', 'Decompress', 'Decompress_ARM64'),
-        os.path.join('randomizer', 'bin', 'Decompress', 'Decompress.out'),
-        os.path.join('randomizer', 'bin', 'Decompress', 'Decompress_ARM64.out'),
+        'OoTRandomizer.py',
+        os.path.join('bin', 'Decompress', 'Decompress'),
+        os.path.join('bin', 'Decompress', 'Decompress_ARM32'),
+        os.path.join('bin', 'Decompress', 'Decompress_ARM64'),
+        os.path.join('bin', 'Decompress', 'Decompress.out'),
+        os.path.join('bin', 'Decompress', 'Decompress_ARM64.out'),
     ]:
-        os.chmod(executable, os.stat(executable).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        executable = os.path.join(extracted, executable)
+        if os.path.isfile(executable):
+            os.chmod(executable, os.stat(executable).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    # Compile the bytecode now rather than on the first seed
+    compileall.compile_dir(extracted, quiet=2, workers=0)
+
+    # A folder left by an install that didn't finish
+    shutil.rmtree(install, ignore_errors=True)
+    shutil.move(extracted, install)
+    shutil.rmtree(staging, ignore_errors=True)
+    # Marked before selecting so the version counts as recently used, the schema is rebuilt later if this fails
+    write_version_marker(install)
+    select_randomizer(install)
 
-    # Delete the zip file
-    cleanup(zippath)
+    # Snapshot the settings tables so rolling settings doesn't need to import the randomizer
+    settings_schema.write_schema(install)
+    prune_randomizer_versions(keep=rslv.randomizer_commit)
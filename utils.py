@@ -1,4 +1,6 @@
 import os
+import random
+import hashlib
 
 def cleanup(file_to_delete):
     """ Delete residual files that are no longer needed """
@@ -18,4 +20,10 @@ def string_to_int(string):
         return string
     if string[-1] == "%":
         return int(string[:-1])
-    return int(string)
\ No newline at end of file
+    return int(string)
+
+def seeded_rng(base_seed, *path):
+    """ An independent random.Random for one part of a run, e.g. (base_seed, seed_index, retry).
+    The stream only depends on the base seed and the path, so any part can be replayed alone. """
+    key = "/".join(str(part) for part in (base_seed,) + path)
+    return random.Random(int.from_bytes(hashlib.sha256(key.encode()).digest(), "big"))